@@ -0,0 +1,254 @@
+import asyncio
+import functools
+import logging
+from typing import Any, Awaitable, Callable, List, Optional, Sequence, Tuple, Type
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+from .core import (
+    _NO_SUFFIX_RANGE,
+    EtagChangedError,
+    GeneralizedResponse,
+    parse_content_range,
+    request_headers,
+)
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type: ignore[assignment,unused-ignore]
+
+# An empty tuple in an except clause matches nothing, which lets us handle
+# aiohttp errors without requiring aiohttp to be installed.
+AIOHTTP_STATUS_ERRORS: Tuple[Type["aiohttp.ClientResponseError"], ...] = (
+    (aiohttp.ClientResponseError,) if aiohttp is not None else ()
+)
+
+LOG = logging.getLogger(__name__)
+
+AsyncGetRange = Callable[..., Awaitable[GeneralizedResponse]]
+
+
+async def aget_range_aiohttp(
+    url: str,
+    content_range: Optional[str],
+    method: Optional[str] = None,
+    session: Optional["aiohttp.ClientSession"] = None,
+) -> GeneralizedResponse:
+    if session is None:
+        raise ValueError("aget_range_aiohttp requires a session")
+    method = method or "GET"
+    headers = request_headers(content_range)
+
+    async with session.request(method, url, headers=headers) as resp:
+        resp.raise_for_status()
+        content = await resp.read()
+        return GeneralizedResponse(
+            str(resp.url),
+            resp.headers.get("content-length"),
+            resp.headers.get("content-range"),
+            resp.headers.get("etag"),
+            content,
+        )
+
+
+class AsyncSeekableHttpFile:
+    """
+    An asyncio counterpart to `SeekableHttpFile` for fetching many ranges at
+    once.
+
+    Ranges are `(lo, hi)` pairs of inclusive byte offsets, the same as the
+    HTTP Range header.  Use as an async context manager, or call `open()` and
+    `close()` yourself.
+    """
+
+    def __init__(
+        self,
+        url: str,
+        get_range: Optional[AsyncGetRange] = None,
+        precache: int = 256_000,
+        session: Optional["aiohttp.ClientSession"] = None,
+        check_etag: bool = True,
+    ) -> None:
+        self.url = url
+        self.get_range = get_range
+        self.precache = precache
+        self.check_etag = check_etag
+        self.etag: Optional[str] = None
+        self.stats = {
+            "num_requests": 0,
+            "optimistic_bytes_read": 0,
+            "lazy_bytes_read": 0,
+            "satisfied_from_cache": 0,
+        }
+        self.length = -1
+        self.end_cache: bytes = b""
+        self.end_cache_start: Optional[int] = None
+
+        self._session = session
+        self._owns_session = False
+
+    @classmethod
+    async def aopen(cls, url: str, **kwargs: Any) -> "AsyncSeekableHttpFile":
+        """
+        Construct and open in one step, so that several files can be opened
+        concurrently with `asyncio.gather`.  The caller is responsible for
+        `close()`.
+        """
+        f = cls(url, **kwargs)
+        await f.open()
+        return f
+
+    async def __aenter__(self) -> "AsyncSeekableHttpFile":
+        await self.open()
+        return self
+
+    async def __aexit__(self, *exc_info: Any) -> None:
+        await self.close()
+
+    async def open(self) -> None:
+        if self.get_range is None:
+            if aiohttp is None:
+                raise ImportError("AsyncSeekableHttpFile requires aiohttp")
+            if self._session is None:
+                self._session = aiohttp.ClientSession(
+                    connector=aiohttp.TCPConnector(limit=16)
+                )
+                self._owns_session = True
+            self.get_range = functools.partial(
+                aget_range_aiohttp, session=self._session
+            )
+
+        try:
+            await self._probe()
+        except BaseException:
+            # Nothing else will close a session we made if the open fails.
+            await self.close()
+            raise
+
+    async def _probe(self) -> None:
+        host = urlsplit(self.url).netloc
+        if host not in _NO_SUFFIX_RANGE:
+            try:
+                # Without precache, the last byte still gets us the length.
+                await self._optimistic_first_read(self.precache or 1)
+                return
+            except HTTPError as e:
+                if e.code not in (416, 501):
+                    raise
+                status = e.code
+            except AIOHTTP_STATUS_ERRORS as e:
+                if e.status not in (416, 501):
+                    raise
+                status = e.status
+            # A 416 (unsatisfiable) is an empty file, which HEAD handles.
+            if status == 501:  # Unsupported range
+                _NO_SUFFIX_RANGE.add(host)
+
+        await self._head()
+
+    async def close(self) -> None:
+        if self._owns_session and self._session is not None:
+            await self._session.close()
+            self._session = None
+            self._owns_session = False
+
+    async def _optimistic_first_read(self, size: int) -> None:
+        assert self.get_range is not None
+        self.stats["num_requests"] += 1
+        resp = await self.get_range(self.url, f"bytes=-{size}")
+
+        assert resp.content is not None
+        if resp.content_range is None:
+            # The server ignored Range and sent the whole file.
+            start = 0
+            self.length = len(resp.content)
+        else:
+            start, end, self.length = parse_content_range(resp.content_range)
+        self.end_cache = resp.content
+        self.stats["optimistic_bytes_read"] = len(self.end_cache)
+        self.end_cache_start = start
+        self._follow(resp)
+
+    async def _head(self) -> None:
+        assert self.get_range is not None
+        self.stats["num_requests"] += 1
+        resp = await self.get_range(self.url, None, method="HEAD")
+
+        assert resp.content_length is not None
+        self.length = int(resp.content_length)
+        self.end_cache_start = max(0, self.length - self.precache)
+        if self.precache and self.length:
+            self.stats["num_requests"] += 1
+            resp = await self.get_range(
+                self.url, f"bytes={self.end_cache_start}-{self.length - 1}"
+            )
+            assert resp.content is not None
+            self.end_cache = resp.content
+            self.stats["optimistic_bytes_read"] = len(self.end_cache)
+        self._follow(resp)
+
+    def _follow(self, resp: GeneralizedResponse) -> None:
+        if resp.url != self.url:
+            LOG.debug("Redirected %s -> %s", self.url, resp.url)
+            self.url = resp.url
+        if resp.etag:
+            if self.etag is None:
+                self.etag = resp.etag
+            elif self.check_etag and self.etag != resp.etag:
+                raise EtagChangedError(
+                    f"Previous etag was {self.etag!r}, new one is {resp.etag!r}"
+                )
+
+    async def read_many(self, ranges: Sequence[Tuple[int, int]]) -> List[bytes]:
+        """
+        Read several ranges, fetching the uncached ones concurrently.
+
+        Results are returned in the same order as `ranges`; like a file, they
+        stop short at the end.
+        """
+        assert self.end_cache_start is not None, "call open() first"
+        results: List[bytes] = [b""] * len(ranges)
+        uncached: List[Tuple[int, int, int]] = []
+        for i, (lo, hi) in enumerate(ranges):
+            hi = min(hi, self.length - 1)
+            if lo > hi:
+                continue
+            p = lo - self.end_cache_start
+            if p >= 0:
+                self.stats["satisfied_from_cache"] += 1
+                results[i] = self.end_cache[p : hi - self.end_cache_start + 1]
+            else:
+                uncached.append((i, lo, hi))
+
+        fetched = await asyncio.gather(*[self._fetch(lo, hi) for _, lo, hi in uncached])
+        for (i, _, _), data in zip(uncached, fetched):
+            results[i] = data
+        return results
+
+    async def _fetch(self, lo: int, hi: int) -> bytes:
+        assert self.get_range is not None
+        self.stats["num_requests"] += 1
+        resp = await self.get_range(self.url, f"bytes={lo}-{hi}")
+        assert resp.content is not None
+        n = hi - lo + 1
+        self.stats["lazy_bytes_read"] += n
+        if len(resp.content) != n:
+            raise ValueError("Truncated read", len(resp.content), n)
+        self._follow(resp)
+        return resp.content
+
+
+def read_many(
+    url: str, ranges: Sequence[Tuple[int, int]], **kwargs: Any
+) -> List[bytes]:
+    """
+    Synchronous wrapper around `AsyncSeekableHttpFile.read_many` for callers
+    that aren't already running an event loop.
+    """
+
+    async def inner() -> List[bytes]:
+        async with AsyncSeekableHttpFile(url, **kwargs) as f:
+            return await f.read_many(ranges)
+
+    return asyncio.run(inner())
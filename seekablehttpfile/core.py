@@ -1,12 +1,36 @@
+import bisect
+import functools
+import http.client
+import inspect
+import io
 import logging
 import os
-import re
+import threading
+import warnings
+from collections import OrderedDict
+from concurrent.futures import Future, ThreadPoolExecutor
 from dataclasses import dataclass
-from typing import Any, Callable, Optional, TypeVar, Union
+from typing import (
+    Any,
+    Callable,
+    Dict,
+    Iterable,
+    List,
+    Optional,
+    Sequence,
+    Set,
+    Tuple,
+    Type,
+    TypeVar,
+    Union,
+)
 from urllib.error import HTTPError
-from urllib.request import Request, urlopen
+from urllib.parse import urljoin, urlsplit
+from urllib.request import getproxies, proxy_bypass, Request, urlopen
 
 import requests.sessions
+import urllib3
+from requests.adapters import HTTPAdapter, Retry
 
 # This is a little strange in order to get mypy to be happy with either.
 F = TypeVar("F", bound=Callable[..., Any])
@@ -24,16 +48,109 @@ try:
 except ImportError:
     pass
 
+try:
+    import httpx
+except ImportError:
+    httpx = None  # type: ignore[assignment,unused-ignore]
+
+# An empty tuple in an except clause matches nothing, which lets us handle
+# httpx errors without requiring httpx to be installed.
+HTTPX_STATUS_ERRORS: Tuple[Type["httpx.HTTPStatusError"], ...] = (
+    (httpx.HTTPStatusError,) if httpx is not None else ()
+)
+
+HTTP_STATUS_ERRORS: Tuple[Type[Exception], ...] = (
+    HTTPError,
+    requests.exceptions.HTTPError,
+) + HTTPX_STATUS_ERRORS
 
 LOG = logging.getLogger(__name__)
 
-CONTENT_RANGE_RE = re.compile(r"bytes (\d+)-(\d+)/(\d+)")
+# Shared by every request that doesn't send a Range header; never mutated.
+NO_HEADERS: Dict[str, str] = {}
+
+# Ranges passed to SeekableHttpFile.prefetch closer together than this are
+# fetched with one request.
+PREFETCH_GAP = 64 * 1024
+
+# Upper bound on the bytes kept from random-access and prefetched reads.
+RANGE_CACHE_BYTES = 4 * 1024 * 1024
+
+# Sequential misses in read() fetch ahead by a window that starts here and
+# doubles each time, up to the max.  A non-sequential miss resets it.
+READAHEAD_MIN = 64 * 1024
+READAHEAD_MAX = 8 * 1024 * 1024
+
+# Hosts that answered a suffix range (bytes=-N) with 501 Not Implemented.
+# Later files on the same host skip straight to HEAD.
+_NO_SUFFIX_RANGE: Set[str] = set()
+
+# Threads SeekableHttpFile.read_ranges uses by default, unless overridden by
+# $SEEKABLEHTTPFILE_WORKERS.
+READ_RANGES_WORKERS = 8
+
+
+def _read_ranges_workers() -> int:
+    try:
+        workers = int(os.environ.get("SEEKABLEHTTPFILE_WORKERS", ""))
+    except ValueError:
+        return READ_RANGES_WORKERS
+    return workers if workers > 0 else READ_RANGES_WORKERS
 
 
 class EtagChangedError(Exception):
     pass
 
 
+def parse_content_range(value: str) -> Tuple[int, int, int]:
+    """
+    Parse a Content-Range value like "bytes 0-99/1000" into (0, 99, 1000).
+
+    Raises ValueError if it isn't in that form.
+    """
+    if not value.startswith("bytes "):
+        raise ValueError(f"Unsupported Content-Range {value!r}")
+    rng, _, total = value[6:].partition("/")
+    lo, _, hi = rng.partition("-")
+    return int(lo), int(hi), int(total)
+
+
+def request_headers(
+    content_range: Optional[str], if_match: Optional[str] = None
+) -> Dict[str, str]:
+    if content_range is None and if_match is None:
+        return NO_HEADERS
+    headers = {}
+    if content_range is not None:
+        headers["Range"] = content_range
+    if if_match is not None:
+        headers["If-Match"] = if_match
+    return headers
+
+
+def http_status(e: BaseException) -> Optional[int]:
+    """
+    Returns the status code from any of the transports' HTTP error exceptions.
+    """
+    if isinstance(e, HTTPError):
+        return e.code
+    elif isinstance(e, requests.exceptions.HTTPError):
+        return e.response.status_code if e.response is not None else None
+    elif isinstance(e, HTTPX_STATUS_ERRORS):
+        return e.response.status_code
+    return None
+
+
+def _accepts_kwarg(func: Callable[..., Any], name: str) -> bool:
+    try:
+        params = inspect.signature(func).parameters
+    except (TypeError, ValueError):
+        return False
+    return name in params or any(
+        p.kind is inspect.Parameter.VAR_KEYWORD for p in params.values()
+    )
+
+
 @dataclass
 class GeneralizedResponse:
     url: str
@@ -43,24 +160,141 @@ class GeneralizedResponse:
     content: Optional[bytes] = None
 
 
+# Stdlib keep-alive connections for get_range_urlopen, one per (scheme, host,
+# port).  The lock serializes use of each connection, since http.client can
+# only have one request outstanding.
+_Conn = Tuple[threading.Lock, http.client.HTTPConnection]
+_CONNS: Dict[Tuple[str, str, int], _Conn] = {}
+_CONNS_LOCK = threading.Lock()
+
+_REDIRECT_CODES = (301, 302, 303, 307, 308)
+_MAX_REDIRECTS = 10
+
+
+def _get_conn(scheme: str, host: str, port: int) -> _Conn:
+    key = (scheme, host, port)
+    with _CONNS_LOCK:
+        entry = _CONNS.get(key)
+        if entry is None:
+            cls = (
+                http.client.HTTPSConnection
+                if scheme == "https"
+                else http.client.HTTPConnection
+            )
+            entry = _CONNS[key] = (threading.Lock(), cls(host, port))
+        return entry
+
+
+def close_all_connections() -> None:
+    """
+    Close the keep-alive connections kept by `get_range_urlopen`.
+    """
+    with _CONNS_LOCK:
+        conns = list(_CONNS.values())
+        _CONNS.clear()
+    for lock, conn in conns:
+        with lock:
+            conn.close()
+
+
+def _request_keepalive(
+    url: str, method: str, headers: Dict[str, str]
+) -> Tuple[http.client.HTTPResponse, bytes]:
+    parts = urlsplit(url)
+    assert parts.hostname is not None, url
+    path = parts.path or "/"
+    if parts.query:
+        path += "?" + parts.query
+    port = parts.port or (443 if parts.scheme == "https" else 80)
+    lock, conn = _get_conn(parts.scheme, parts.hostname, port)
+
+    with lock:
+        try:
+            try:
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+            except ConnectionError:
+                # The server closed an idle keep-alive connection (this
+                # includes RemoteDisconnected); GET and HEAD are safe to send
+                # again.
+                conn.close()
+                conn.request(method, path, headers=headers)
+                resp = conn.getresponse()
+            return resp, resp.read()
+        except BaseException:
+            # Don't leave a half-read response on a pooled connection.
+            conn.close()
+            raise
+
+
 @ktrace("content_range", "method")
 def get_range_urlopen(
-    url: str, content_range: Optional[str], method: Optional[str] = None
+    url: str,
+    content_range: Optional[str],
+    method: Optional[str] = None,
+    if_match: Optional[str] = None,
 ) -> GeneralizedResponse:
+    warnings.warn(
+        "get_range_urlopen is deprecated; use get_range_urllib3 instead",
+        DeprecationWarning,
+        stacklevel=2,
+    )
     method = method or "GET"
-    headers = {"Range": content_range} if content_range is not None else {}
-    # This is expected to raise an exception with .code
-    resp = urlopen(Request(url, headers=headers, method=method))
+    headers = request_headers(content_range, if_match)
+
+    scheme = urlsplit(url).scheme
+    if scheme in getproxies() and not proxy_bypass(urlsplit(url).hostname or ""):
+        # Leave proxies to urlopen, which knows how to talk to them.
+        # This is expected to raise an exception with .code
+        resp = urlopen(Request(url, headers=headers, method=method))
+        return GeneralizedResponse(
+            resp.url,
+            resp.headers["content-length"],
+            resp.headers["content-range"],
+            resp.headers.get("etag"),
+            resp.read(),
+        )
+
+    for _ in range(_MAX_REDIRECTS + 1):
+        r, body = _request_keepalive(url, method, headers)
+        location = r.headers.get("location")
+        if r.status not in _REDIRECT_CODES or not location:
+            break
+        url = urljoin(url, location)
+
+    if not 200 <= r.status < 300:
+        # Same exception (with .code) that urlopen raises.
+        raise HTTPError(url, r.status, r.reason, r.headers, None)
     return GeneralizedResponse(
-        resp.url,
-        resp.headers["content-length"],
-        resp.headers["content-range"],
-        resp.headers.get("etag"),
-        resp.read(),
+        url,
+        r.headers["content-length"],
+        r.headers["content-range"],
+        r.headers.get("etag"),
+        body,
     )
 
 
-DEFAULT_SESSION = requests.sessions.Session()
+def _make_default_session() -> requests.sessions.Session:
+    session = requests.sessions.Session()
+    # Keep connections alive between range requests, and retry the transient
+    # failures that CDNs like to hand out.  raise_on_status=False means we get
+    # the last response back and raise_for_status still produces HTTPError.
+    adapter = HTTPAdapter(
+        pool_connections=10,
+        pool_maxsize=10,
+        max_retries=Retry(
+            total=3,
+            backoff_factor=0.2,
+            status_forcelist=[502, 503, 504],
+            raise_on_status=False,
+        ),
+    )
+    session.mount("https://", adapter)
+    session.mount("http://", adapter)
+    return session
+
+
+DEFAULT_SESSION = _make_default_session()
 
 
 @ktrace("content_range", "method")
@@ -69,16 +303,118 @@ def get_range_requests(
     content_range: Optional[str],
     method: Optional[str] = None,
     session: Optional[requests.sessions.Session] = None,
+    if_match: Optional[str] = None,
 ) -> GeneralizedResponse:
     method = method or "GET"
     if not session:
         session = DEFAULT_SESSION
-    headers = {"Range": content_range} if content_range is not None else {}
+    headers = request_headers(content_range, if_match)
+
+    # With stream=True the body is read by urllib3 in one go, which is a
+    # single allocation; resp.content would build a list of 10KB chunks and
+    # then join them.
+    resp = session.request(method=method, url=url, headers=headers, stream=True)
+    try:
+        resp.raise_for_status()
+        return GeneralizedResponse(
+            resp.url,
+            resp.headers["content-length"],
+            resp.headers.get("content-range"),
+            resp.headers.get("etag"),
+            resp.raw.read(decode_content=True),
+        )
+    finally:
+        resp.close()
 
-    resp = session.request(method=method, url=url, headers=headers)
+
+# Talking to urllib3 directly skips requests' per-call work (cookies, hooks,
+# environment merging, PreparedRequest) while pooling connections the same way.
+DEFAULT_POOL = urllib3.PoolManager(
+    num_pools=4,
+    maxsize=10,
+    retries=urllib3.Retry(
+        connect=3,
+        read=3,
+        status=3,
+        redirect=10,
+        backoff_factor=0.2,
+        status_forcelist=[502, 503, 504],
+        raise_on_status=False,
+    ),
+)
+
+
+@ktrace("content_range", "method")
+def get_range_urllib3(
+    url: str,
+    content_range: Optional[str],
+    method: Optional[str] = None,
+    pool: Optional[urllib3.PoolManager] = None,
+    if_match: Optional[str] = None,
+) -> GeneralizedResponse:
+    method = method or "GET"
+    if not pool:
+        pool = DEFAULT_POOL
+    headers = request_headers(content_range, if_match)
+
+    resp = pool.request(method, url, headers=headers, preload_content=False)
+    try:
+        if resp.status >= 400:
+            # Same exception as urlopen, so callers only need to handle one.
+            raise HTTPError(
+                url, resp.status, resp.reason or "", resp.headers, None  # type: ignore[arg-type]
+            )
+        # resp.url is only the path after a redirect; the history has the
+        # absolute one.
+        if resp.retries is not None:
+            for h in resp.retries.history:
+                if h.redirect_location:
+                    url = urljoin(h.url or url, h.redirect_location)
+        return GeneralizedResponse(
+            url,
+            resp.headers.get("content-length"),
+            resp.headers.get("content-range"),
+            resp.headers.get("etag"),
+            resp.read(),
+        )
+    finally:
+        resp.release_conn()
+
+
+_DEFAULT_HTTPX_CLIENT: Optional["httpx.Client"] = None
+
+
+def _default_httpx_client() -> "httpx.Client":
+    global _DEFAULT_HTTPX_CLIENT
+    if _DEFAULT_HTTPX_CLIENT is None:
+        # http2 lets concurrent range requests share one connection.
+        _DEFAULT_HTTPX_CLIENT = httpx.Client(
+            http2=True,
+            follow_redirects=True,
+            limits=httpx.Limits(max_keepalive_connections=10),
+        )
+    return _DEFAULT_HTTPX_CLIENT
+
+
+@ktrace("content_range", "method")
+def get_range_httpx(
+    url: str,
+    content_range: Optional[str],
+    method: Optional[str] = None,
+    client: Optional["httpx.Client"] = None,
+    if_match: Optional[str] = None,
+) -> GeneralizedResponse:
+    if httpx is None:
+        raise ImportError("get_range_httpx requires httpx[http2] to be installed")
+    method = method or "GET"
+    if not client:
+        client = _default_httpx_client()
+    headers = request_headers(content_range, if_match)
+
+    resp = client.request(method, url, headers=headers)
     resp.raise_for_status()
     return GeneralizedResponse(
-        resp.url,
+        str(resp.url),
         resp.headers["content-length"],
         resp.headers.get("content-range"),
         resp.headers.get("etag"),
@@ -86,52 +422,199 @@ def get_range_requests(
     )
 
 
-class SeekableHttpFile:
+class _RangeCache:
+    """
+    Byte ranges fetched from outside the end cache, keyed by their start
+    offset and kept sorted so that lookups are a bisect.  No range is kept
+    inside another, so ends are sorted too and the one range starting at or
+    before an offset is the only one that can hold it.
+
+    Bounded by the total size of the ranges, evicting the least recently used.
+    A range over half that size is a bulk copy, not something a reader comes
+    back to, so it isn't kept at all rather than pushing out the ones that are.
+    Safe to share between threads.
+    """
+
+    def __init__(self, max_bytes: int = RANGE_CACHE_BYTES) -> None:
+        self.max_bytes = max_bytes
+        self._starts: List[int] = []
+        self._data: "OrderedDict[int, bytes]" = OrderedDict()
+        self._bytes = 0
+        self._lock = threading.Lock()
+
+    def add(self, start: int, data: bytes) -> None:
+        if len(data) > self.max_bytes // 2:
+            return
+        with self._lock:
+            self._add(start, data)
+
+    def _add(self, start: int, data: bytes) -> None:
+        end = start + len(data)
+        i = bisect.bisect_right(self._starts, start) - 1
+        if i >= 0:
+            s = self._starts[i]
+            if s + len(self._data[s]) >= end:
+                # Already have all of it.
+                self._data.move_to_end(s)
+                return
+
+        # Drop the ranges this one covers.
+        i = bisect.bisect_left(self._starts, start)
+        while i < len(self._starts):
+            s = self._starts[i]
+            if s + len(self._data[s]) > end:
+                break
+            del self._starts[i]
+            self._bytes -= len(self._data.pop(s))
+        self._starts.insert(i, start)
+        self._data[start] = data
+        self._bytes += len(data)
+
+        while self._bytes > self.max_bytes:
+            old_start, old_data = self._data.popitem(last=False)
+            del self._starts[bisect.bisect_left(self._starts, old_start)]
+            self._bytes -= len(old_data)
+
+    def get(self, start: int, n: int) -> Optional[bytes]:
+        """
+        Returns `n` bytes at `start` if one cached range holds all of them.
+        """
+        with self._lock:
+            return self._get(start, n)
+
+    def _get(self, start: int, n: int) -> Optional[bytes]:
+        i = bisect.bisect_right(self._starts, start) - 1
+        if i < 0:
+            return None
+        s = self._starts[i]
+        data = self._data[s]
+        p = start - s
+        if p + n > len(data):
+            return None
+        self._data.move_to_end(s)
+        return data[p : p + n]
+
+
+class SeekableHttpFile(io.RawIOBase):
+    """
+    A read-only, seekable file whose contents are fetched with range requests.
+
+    This is a raw (unbuffered) file; wrap it in `io.BufferedReader` if you'd
+    like buffering.
+    """
+
     def __init__(
         self,
         url: str,
-        get_range: Callable[..., GeneralizedResponse] = get_range_urlopen,
+        get_range: Optional[Callable[..., GeneralizedResponse]] = None,
         precache: int = 256_000,
         check_etag: bool = True,
+        session: Optional[requests.sessions.Session] = None,
+        background_readahead: bool = False,
+        range_cache_bytes: int = RANGE_CACHE_BYTES,
+        precomputed_length: Optional[int] = None,
+        precomputed_tail: Optional[bytes] = None,
+        concurrent_probe: bool = False,
     ) -> None:
+        super().__init__()
+        if get_range is None:
+            get_range = get_range_urllib3 if session is None else get_range_requests
+        if session is not None:
+            if not _accepts_kwarg(get_range, "session"):
+                raise ValueError(f"session= can't be passed to {get_range!r}")
+            get_range = functools.partial(get_range, session=session)
         self.url = url
+        self.check_etag = check_etag
         self.get_range = get_range
-        self.stats = {
-            "num_requests": 0,
-            "optimistic_bytes_read": 0,
-            "lazy_bytes_read": 0,
-            "satisfied_from_cache": 0,
-        }
+        self._num_requests = 0
+        self._optimistic_bytes_read = 0
+        self._lazy_bytes_read = 0
+        self._satisfied_from_cache = 0
+        self._forward_skip_bytes = 0
         self.pos = 0
         self.length = -1
         self.precache = precache
-        self.check_etag = check_etag
         self.etag: Optional[str] = None
 
         self.end_cache: bytes = b""
+        self._end_mv = memoryview(self.end_cache)
         self.end_cache_start: Optional[int] = None
+        self._range_cache = _RangeCache(range_cache_bytes)
+
+        # Kept apart from end_cache so streaming through the file doesn't
+        # evict the part a zip reader keeps coming back to.
+        self._readahead: bytes = b""
+        self._readahead_start = 0
+        self._readahead_window = 0
+        self._last_end = -1
+
+        # With background_readahead, the window after the current one is
+        # fetched on a worker thread while the caller is busy with this one.
+        self.background_readahead = background_readahead
+        self._executor: Optional[ThreadPoolExecutor] = None
+        self._pending: Optional[Tuple[int, int, "Future[bytes]"]] = None
 
-        if self.precache:
+        # (start, n) -> result of a fetch that's currently in progress.
+        self._inflight: Dict[Tuple[int, int], "Future[bytes]"] = {}
+        self._inflight_lock = threading.Lock()
+
+        host = urlsplit(url).netloc
+        started: Optional["Future[GeneralizedResponse]"] = None
+        empty = False
+        if precomputed_length is not None:
+            # Known from elsewhere (say, an earlier open of the same file), so
+            # nothing is fetched until the first read needs it.
+            tail = precomputed_tail or b""
+            if len(tail) > precomputed_length:
+                raise ValueError("precomputed_tail is longer than precomputed_length")
+            self.length = precomputed_length
+            self._set_end_cache(tail)
+            self._optimistic_bytes_read = 0
+            self.end_cache_start = self.length - len(tail)
+        elif precomputed_tail is not None:
+            raise ValueError("precomputed_tail requires precomputed_length")
+        elif host not in _NO_SUFFIX_RANGE:
+            if concurrent_probe:
+                # Send the fallback at the same time, so that a server which
+                # rejects suffix ranges doesn't cost another round trip.
+                if self._executor is None:
+                    self._executor = ThreadPoolExecutor(max_workers=1)
+                self._num_requests += 1
+                started = self._executor.submit(self._head_request)
             try:
-                # Try to read the length and satisfy initial zipfile reads with one
-                # request.  Varnish (used on public pypi) does not support this, but
-                # Apache and probably nginx does.
-                self._optimistic_first_read()
-                return
-            except HTTPError as e:
-                if e.code != 501:  # Unsupported range
-                    raise
-            except requests.exceptions.HTTPError as e:
-                if e.response.status_code != 501:  # Unsupported range
+                # Try to read the length and satisfy initial zipfile reads with
+                # one request.  Varnish (used on public pypi) does not support
+                # this, but Apache and probably nginx does.  Even when not
+                # precaching, asking for the last byte finds the length in the
+                # same one request that a HEAD would take.
+                self._optimistic_first_read(self.precache or 1)
+            except HTTP_STATUS_ERRORS as e:
+                status = http_status(e)
+                if status == 501:  # Unsupported range
+                    _NO_SUFFIX_RANGE.add(host)
+                elif status == 416:
+                    # Any suffix range of a non-empty file is satisfiable, and
+                    # asking for the start would get a 416 too.
+                    empty = True
+                else:
                     raise
+            else:
+                if started is not None:
+                    started.add_done_callback(self._cache_head)
+                    started = None
+
+        if self.end_cache_start is None:
+            # Being optimistic didn't work, fall back to reading from the start
+            self._head(None if empty else started, head_only=empty)
 
-        # Just read the length if not precaching or being optimistic didn't work
-        self._head()
+        if self.end_cache_start == 0:
+            # The whole file fit, so reads never need anything but a slice.
+            self.read = self._read_complete  # type: ignore[method-assign]
 
     @ktrace()
-    def _optimistic_first_read(self) -> None:
+    def _optimistic_first_read(self, size: int) -> None:
         """
-        Read (up to) some length, using suffix-length.
+        Read (up to) `size` bytes from the end, using suffix-length.
 
         This lets us find the last bytes in the file (which we're sure to need
         if it's a zip) as well as figure out the total length using a single
@@ -142,68 +625,153 @@ class SeekableHttpFile:
         # the length and the first couple of reads (2 bytes from the end and 22
         # bytes from the end).  The default value was chosen looking at scipy
         # and saves another half-second for me.
-        h = "bytes=-%d" % self.precache
-        self.stats["num_requests"] += 1
+        h = f"bytes=-{size}"
+        self._num_requests += 1
         resp = self.get_range(self.url, h)
 
-        assert resp.content_range is not None
-        match = CONTENT_RANGE_RE.match(resp.content_range)
-        assert match is not None, resp.content_range
-        start, end, length = match.groups()
-        self.length = int(length)
         assert resp.content is not None
-        self.end_cache = resp.content
-        self.stats["optimistic_bytes_read"] = len(self.end_cache)
-        self.end_cache_start = int(start)
+        if resp.content_range is None:
+            # The server ignored Range and sent the whole file.
+            start = 0
+            self.length = len(resp.content)
+        else:
+            start, end, self.length = parse_content_range(resp.content_range)
+        self._set_end_cache(resp.content)
+        self.end_cache_start = start
         # print(type(self.end_cache), self.end_cache_start, url)
         assert self.end_cache_start >= 0
 
         if resp.url != self.url:
             LOG.debug("Redirected %s -> %s", self.url, resp.url)
-            self.url = resp.url
+            self._set_url(resp.url)
         if resp.etag:
             assert self.etag is None
             self.etag = resp.etag
 
     @ktrace()
-    def _head(self) -> None:
+    def _head(
+        self,
+        started: Optional["Future[GeneralizedResponse]"] = None,
+        head_only: bool = False,
+    ) -> None:
         """
-        Issue a HEAD request to find the length, then precache if desired.
+        Find the length without a suffix range, then precache if desired.
+
+        When precaching, this asks for the first `precache` bytes rather than
+        issuing a HEAD (unless `head_only`).  Content-Range has the length
+        either way, and a file that small is then read completely in that one
+        request.  For a larger one the head is kept in the range cache (zip
+        local headers start at 0) and the tail is fetched separately.
         """
         LOG.debug("_head")
-        self.stats["num_requests"] += 1
-        resp = self.get_range(self.url, None, method="HEAD")
-
-        assert resp.content_length is not None
-        self.length = int(resp.content_length)
-        self.end_cache_start = max(0, self.length - self.precache)
-        if self.precache:
-            self.stats["num_requests"] += 1
-            resp = self.get_range(
-                self.url, "bytes=%d-%d" % (self.end_cache_start, self.length - 1)
-            )
+        if started is not None:
+            resp = started.result()
+        elif head_only:
+            self._num_requests += 1
+            resp = self._get(None, method="HEAD")
+        else:
+            self._num_requests += 1
+            resp = self._head_request()
+
+        if head_only or not self.precache:
+            assert resp.content_length is not None
+            self.length = int(resp.content_length)
+            self.end_cache_start = self.length
+        else:
             assert resp.content is not None
-            self.end_cache = resp.content
-            self.stats["optimistic_bytes_read"] = len(self.end_cache)
+            if resp.content_range is None:
+                # The server ignored Range and sent the whole file.
+                self.length = len(resp.content)
+            else:
+                _, _, self.length = parse_content_range(resp.content_range)
+
+            if resp.content_range is None or self.length <= self.precache:
+                self.end_cache_start = 0
+                self._set_end_cache(resp.content)
+            else:
+                head = resp.content
+                self._range_cache.add(0, head)
+                self.end_cache_start = self.length - self.precache
+                self._num_requests += 1
+                resp = self.get_range(
+                    self.url, f"bytes={self.end_cache_start}-{self.length - 1}"
+                )
+                assert resp.content is not None
+                self._set_end_cache(resp.content)
+                self._optimistic_bytes_read += len(head)
 
         if resp.url != self.url:
             LOG.debug("Redirected %s -> %s", self.url, resp.url)
-            self.url = resp.url
+            self._set_url(resp.url)
         if resp.etag:
             assert self.etag is None
             self.etag = resp.etag
 
-    def seek(self, pos: int, whence: int = 0) -> None:
-        LOG.debug(f"seek {pos} {whence}")
+    def _head_request(self) -> GeneralizedResponse:
+        if not self.precache:
+            return self._get(None, method="HEAD")
+        return self._get(f"bytes=0-{self.precache - 1}")
+
+    def _cache_head(self, fut: "Future[GeneralizedResponse]") -> None:
+        """
+        Keeps the result of a concurrent probe that turned out not to be
+        needed, since zip local headers start at 0.
+        """
+        if fut.cancelled() or fut.exception() is not None:
+            return
+        resp = fut.result()
+        if resp.content and resp.content_range:
+            lo, _, _ = parse_content_range(resp.content_range)
+            if lo == 0:
+                self._range_cache.add(0, resp.content)
+                self._optimistic_bytes_read += len(resp.content)
+
+    # The url is bound into _get once (and again on redirect or a new
+    # get_range) rather than on every read.
+    @property
+    def get_range(self) -> Callable[..., GeneralizedResponse]:
+        return self._get_range
+
+    @get_range.setter
+    def get_range(self, get_range: Callable[..., GeneralizedResponse]) -> None:
+        self._get_range = get_range
+        self._get = functools.partial(get_range, self.url)
+        # Custom get_range functions might not know about If-Match.
+        self._send_if_match = self.check_etag and _accepts_kwarg(get_range, "if_match")
+
+    def _set_url(self, url: str) -> None:
+        self.url = url
+        self._get = functools.partial(self._get_range, url)
+
+    @property
+    def stats(self) -> Dict[str, int]:
+        return {
+            "num_requests": self._num_requests,
+            "optimistic_bytes_read": self._optimistic_bytes_read,
+            "lazy_bytes_read": self._lazy_bytes_read,
+            "satisfied_from_cache": self._satisfied_from_cache,
+            "forward_skip_bytes": self._forward_skip_bytes,
+        }
+
+    def _set_end_cache(self, data: bytes) -> None:
+        self.end_cache = data
+        self._end_mv = memoryview(data)
+        self._optimistic_bytes_read = len(data)
+
+    def getbuffer(self) -> memoryview:
+        """
+        Returns a read-only view of the end cache, without copying it.
+        """
+        return self._end_mv
+
+    def seek(self, pos: int, whence: int = 0) -> int:
+        LOG.debug("seek %s %s", pos, whence)
         # TODO clamp/error
-        if whence == os.SEEK_SET:
-            self.pos = pos
-        elif whence == os.SEEK_CUR:
-            self.pos += pos
-        elif whence == os.SEEK_END:
-            self.pos = self.length + pos
-        else:
+        if not os.SEEK_SET <= whence <= os.SEEK_END:
             raise ValueError(f"Invalid value for whence: {whence!r}")
+        # Indexed by whence: SEEK_SET, SEEK_CUR, SEEK_END
+        self.pos = (pos, self.pos + pos, self.length + pos)[whence]
+        return self.pos
 
     def tell(self) -> int:
         LOG.debug("tell")
@@ -211,32 +779,245 @@ class SeekableHttpFile:
 
     @ktrace("self.pos", "n")
     def read(self, n: int = -1) -> bytes:
-        LOG.debug(f"read {n} @ {self.length - self.pos}")
-        if n == -1:
-            n = self.length - self.pos
         if n == 0:
             return b""
+        LOG.debug("read %s @ %s", n, self.length - self.pos)
+        # Like a real file, a read past the end is short rather than an error.
+        remaining = self.length - self.pos
+        if n < 0 or n > remaining:
+            n = remaining
+            if n <= 0:
+                return b""
+
+        end_cache_start = self.end_cache_start
+        assert end_cache_start is not None
+        pos = self.pos
+        skip = pos - self._last_end
+        # Skipping ahead only continues the stream if it lands in data that's
+        # already been read ahead; otherwise it's random access.
+        sequential = skip == 0 or (skip > 0 and self._in_window(pos))
+
+        # The position only moves once we have the data, so that a read which
+        # raises (say, on a dropped connection) can be retried.
+        p = pos - end_cache_start
+        if p >= 0:
+            self._satisfied_from_cache += 1
+            self.pos = self._last_end = pos + n
+            return self.end_cache[p : p + n]
+
+        p = pos - self._readahead_start
+        if p >= 0 and p + n <= len(self._readahead):
+            self._satisfied_from_cache += 1
+            self.pos = self._last_end = pos + n
+            return self._readahead[p : p + n]
+
+        data = self._range_cache.get(pos, n)
+        if data is not None:
+            self._satisfied_from_cache += 1
+            self.pos = self._last_end = pos + n
+            return data
+
+        if not sequential:
+            self._readahead_window = 0
+            self._cancel_pending()
+            data = self._fetch(pos, n)
+            self._range_cache.add(pos, data)
+            self.pos = self._last_end = pos + n
+            return data
+
+        if skip:
+            self._forward_skip_bytes += skip
+        else:
+            self._readahead_window = min(
+                max(self._readahead_window * 2, READAHEAD_MIN), READAHEAD_MAX
+            )
+        # Keep whatever is left of the current readahead so that a read
+        # straddling its end only fetches the part we don't have.
+        head = b""
+        p = pos - self._readahead_start
+        if 0 <= p < len(self._readahead):
+            head = self._readahead[p:]
+        start = pos + len(head)
+
+        fetched = self._take_pending(start, n - len(head))
+        if fetched is None:
+            # Don't read past the end cache, we already have that part.
+            want = max(
+                n - len(head),
+                min(self._readahead_window, end_cache_start - start),
+            )
+            fetched = self._fetch(start, want)
+
+        data = head + fetched if head else fetched
+        self._readahead = data
+        self._readahead_start = pos
+        self.pos = self._last_end = pos + n
+
+        if self.background_readahead:
+            next_start = start + len(fetched)
+            want = min(self._readahead_window, end_cache_start - next_start)
+            if want > 0:
+                self._submit_pending(next_start, want)
+        return data[:n]
+
+    def _in_window(self, pos: int) -> bool:
+        """
+        Whether `pos` is inside the current readahead or the pending background
+        one.
+        """
+        if 0 <= pos - self._readahead_start < len(self._readahead):
+            return True
+        if self._pending is not None:
+            start, n, _ = self._pending
+            return start <= pos < start + n
+        return False
+
+    def _submit_pending(self, start: int, n: int) -> None:
+        if self._executor is None:
+            self._executor = ThreadPoolExecutor(max_workers=1)
+        self._pending = (start, n, self._executor.submit(self._fetch, start, n))
+
+    def _take_pending(self, start: int, n: int) -> Optional[bytes]:
+        """
+        Returns the background readahead result from `start` on if it covers
+        at least `n` bytes, otherwise discards it.
+        """
+        if self._pending is None:
+            return None
+        pending_start, pending_n, fut = self._pending
+        self._pending = None
+        p = start - pending_start
+        if p < 0 or p + n > pending_n:
+            fut.cancel()
+            return None
+        data = fut.result()
+        return data[p:] if p else data
+
+    def _cancel_pending(self) -> None:
+        if self._pending is not None:
+            self._pending[2].cancel()
+            self._pending = None
+
+    def close(self) -> None:
+        self._cancel_pending()
+        if self._executor is not None:
+            self._executor.shutdown(wait=False)
+            self._executor = None
+        super().close()
+
+    def _read_complete(self, n: int = -1) -> bytes:
+        """
+        Replaces read() when end_cache holds the entire file.
+        """
+        if n == 0:
+            return b""
+        pos = self.pos
+        remaining = self.length - pos
+        if n < 0 or n > remaining:
+            n = remaining
+            if n <= 0:
+                return b""
+        self._satisfied_from_cache += 1
+        self.pos = pos + n
+        return self.end_cache[pos : pos + n]
+
+    def readinto(self, buf: Any) -> int:
+        """
+        Read up to `len(buf)` bytes into `buf`, returning how many were read.
+
+        Hits in the end cache or readahead are copied straight from them,
+        without creating an intermediate bytes object.
+        """
+        mv = memoryview(buf).cast("B")
+        n = min(len(mv), self.length - self.pos)
+        if n <= 0:
+            return 0
 
         assert self.end_cache_start is not None
         p = self.pos - self.end_cache_start
         if p >= 0:
-            self.stats["satisfied_from_cache"] += 1
+            self._satisfied_from_cache += 1
             self.pos += n
-            return self.end_cache[p : p + n]
+            self._last_end = self.pos
+            mv[:n] = self._end_mv[p : p + n]
+            return n
+
+        p = self.pos - self._readahead_start
+        if p >= 0 and p + n <= len(self._readahead):
+            self._satisfied_from_cache += 1
+            self.pos += n
+            self._last_end = self.pos
+            mv[:n] = memoryview(self._readahead)[p : p + n]
+            return n
+
+        data = self.read(n)
+        mv[: len(data)] = data
+        return len(data)
+
+    def _fetch(self, start: int, n: int) -> bytes:
+        """
+        Fetch `n` bytes starting at `start`, bypassing the caches.
+
+        If another thread (or the background readahead) is already fetching a
+        range that covers this one, waits for that instead of issuing a second
+        request.
+        """
+        with self._inflight_lock:
+            waiting = self._find_inflight(start, n)
+            if waiting is None:
+                fut: "Future[bytes]" = Future()
+                self._inflight[(start, n)] = fut
 
-        self.stats["num_requests"] += 1
-        resp = self.get_range(self.url, "bytes=%d-%d" % (self.pos, self.pos + n - 1))
+        if waiting is not None:
+            s, other = waiting
+            return other.result()[start - s : start - s + n]
+
+        try:
+            data = self._request_range(start, n)
+        except BaseException as e:
+            fut.set_exception(e)
+            raise
+        else:
+            fut.set_result(data)
+            return data
+        finally:
+            with self._inflight_lock:
+                del self._inflight[(start, n)]
+
+    def _find_inflight(
+        self, start: int, n: int
+    ) -> Optional[Tuple[int, "Future[bytes]"]]:
+        for (s, m), fut in self._inflight.items():
+            if s <= start and start + n <= s + m:
+                return s, fut
+        return None
+
+    def _request_range(self, start: int, n: int) -> bytes:
+        self._num_requests += 1
+        h = f"bytes={start}-{start + n - 1}"
+        # Weak etags can't be used with If-Match, which requires a strong
+        # comparison.
+        if self._send_if_match and self.etag and not self.etag.startswith("W/"):
+            try:
+                resp = self._get(h, if_match=self.etag)
+            except HTTP_STATUS_ERRORS as e:
+                if http_status(e) == 412:  # Precondition Failed
+                    raise EtagChangedError(
+                        f"Previous etag was {self.etag!r}, server no longer matches"
+                    ) from e
+                raise
+        else:
+            resp = self._get(h)
         assert resp.content is not None
         data = resp.content
 
-        self.stats["lazy_bytes_read"] += n
-        self.pos += n
+        self._lazy_bytes_read += n
         if len(data) != n:
             raise ValueError("Truncated read", len(data), n)
 
         if resp.url != self.url:
             LOG.debug("Redirected on subsequent read %s -> %s", self.url, resp.url)
-            self.url = resp.url
+            self._set_url(resp.url)
         if resp.etag:
             # It's a little weird to find out an etag on subsequent request, but
             # possible I suppose.
@@ -249,5 +1030,81 @@ class SeekableHttpFile:
 
         return data
 
+    def prefetch(
+        self, ranges: Iterable[Tuple[int, int]], gap: int = PREFETCH_GAP
+    ) -> None:
+        """
+        Fetch `(lo, hi)` ranges (inclusive, like the Range header) ahead of
+        the reads that will want them.
+
+        Ranges within `gap` bytes of each other are merged so that a cluster
+        of small reads (say, zip local headers) costs a single request, as long
+        as the merged range is small enough to be kept in the range cache.
+        """
+        assert self.end_cache_start is not None
+        limit = self._range_cache.max_bytes // 2
+        merged: List[List[int]] = []
+        for lo, hi in sorted(ranges):
+            hi = min(hi, self.length - 1)
+            if lo > hi or lo >= self.end_cache_start:
+                continue
+            if self._range_cache.get(lo, hi - lo + 1) is not None:
+                continue
+            if (
+                merged
+                and lo - merged[-1][1] <= gap + 1
+                and max(merged[-1][1], hi) - merged[-1][0] < limit
+            ):
+                merged[-1][1] = max(merged[-1][1], hi)
+            else:
+                merged.append([lo, hi])
+
+        for lo, hi in merged:
+            self._range_cache.add(lo, self._fetch(lo, hi - lo + 1))
+
+    def read_ranges(
+        self, ranges: Sequence[Tuple[int, int]], max_workers: Optional[int] = None
+    ) -> List[bytes]:
+        """
+        Read several `(offset, length)` ranges, fetching the uncached ones
+        concurrently.
+
+        Results are returned in the same order as `ranges`.  Unlike `read`,
+        this doesn't move the file position.
+        """
+        assert self.end_cache_start is not None
+        results: List[bytes] = [b""] * len(ranges)
+        misses: List[Tuple[int, int, int]] = []
+        for i, (pos, n) in enumerate(ranges):
+            n = max(0, min(n, self.length - pos))
+            p = pos - self.end_cache_start
+            if p >= 0:
+                self._satisfied_from_cache += 1
+                results[i] = self.end_cache[p : p + n]
+                continue
+            data = self._range_cache.get(pos, n)
+            if data is not None:
+                self._satisfied_from_cache += 1
+                results[i] = data
+            elif n:
+                misses.append((i, pos, n))
+
+        if len(misses) == 1:
+            fetched = [self._fetch(misses[0][1], misses[0][2])]
+        elif misses:
+            workers = min(max_workers or _read_ranges_workers(), len(misses))
+            with ThreadPoolExecutor(workers) as pool:
+                fetched = list(pool.map(lambda m: self._fetch(m[1], m[2]), misses))
+        else:
+            fetched = []
+
+        for (i, pos, _), data in zip(misses, fetched):
+            self._range_cache.add(pos, data)
+            results[i] = data
+        return results
+
     def seekable(self) -> bool:
         return True
+
+    def readable(self) -> bool:
+        return True
@@ -1,17 +1,34 @@
 import doctest
 from unittest import TestLoader, TestSuite
 
+from .aio import AsyncSeekableHttpFileTest
 from .core import SeekableHttpFileTest
-from .live import LiveTests
+from .live import LIVE, LiveHttpxTests, LiveRequestsTests, LiveTests, LiveUrllib3Tests
+from .local import (
+    LocalHttpxTests,
+    LocalRequestsTests,
+    LocalUrllib3Tests,
+    LocalUrlopenTests,
+)
 
 
 def load_tests(loader: TestLoader, tests: TestSuite, _pattern: None) -> TestSuite:
-    tests.addTests(doctest.DocFileSuite("../../README.md"))
+    if LIVE:
+        # The example in the README fetches from pypi.
+        tests.addTests(doctest.DocFileSuite("../../README.md"))
     return tests
 
 
 __all__ = [
+    "AsyncSeekableHttpFileTest",
     "SeekableHttpFileTest",
+    "LiveHttpxTests",
+    "LiveRequestsTests",
     "LiveTests",
+    "LiveUrllib3Tests",
+    "LocalHttpxTests",
+    "LocalRequestsTests",
+    "LocalUrllib3Tests",
+    "LocalUrlopenTests",
     "load_tests",
 ]
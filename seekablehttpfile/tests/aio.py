@@ -0,0 +1,176 @@
+import asyncio
+import unittest
+import urllib.error
+from typing import Any, List, Optional
+
+from seekablehttpfile.aio import AsyncSeekableHttpFile, read_many
+from seekablehttpfile.core import (
+    _NO_SUFFIX_RANGE,
+    EtagChangedError,
+    GeneralizedResponse,
+)
+
+from .core import Fixture
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None  # type:ignore[assignment,unused-ignore]
+
+
+class AsyncFixture(Fixture):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.in_flight = 0
+        self.max_in_flight = 0
+
+    async def aget_range(
+        self, url: str, t: Optional[str], method: Optional[str] = "GET"
+    ) -> GeneralizedResponse:
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            await asyncio.sleep(0.01)
+            return self.get_range(url, t, method)
+        finally:
+            self.in_flight -= 1
+
+
+class AsyncSeekableHttpFileTest(unittest.TestCase):
+    def setUp(self) -> None:
+        _NO_SUFFIX_RANGE.clear()
+
+    def test_read_many(self) -> None:
+        r = AsyncFixture()
+
+        async def inner() -> List[bytes]:
+            async with AsyncSeekableHttpFile(
+                "", get_range=r.aget_range, precache=2
+            ) as f:
+                self.assertEqual(3, f.length)
+                self.assertEqual(b"oo", f.end_cache)
+                result = await f.read_many([(0, 0), (1, 2), (0, 1), (2, 2)])
+                self.assertEqual(3, f.stats["num_requests"])
+                self.assertEqual(2, f.stats["satisfied_from_cache"])
+                self.assertEqual(3, f.stats["lazy_bytes_read"])
+                return result
+
+        self.assertEqual([b"f", b"oo", b"fo", b"o"], asyncio.run(inner()))
+        # Both misses were outstanding at the same time.
+        self.assertEqual(2, r.max_in_flight)
+
+    def test_aopen_many(self) -> None:
+        r = AsyncFixture()
+
+        async def inner() -> List[AsyncSeekableHttpFile]:
+            return await asyncio.gather(
+                *[
+                    AsyncSeekableHttpFile.aopen(
+                        str(i), get_range=r.aget_range, precache=2
+                    )
+                    for i in range(8)
+                ]
+            )
+
+        files = asyncio.run(inner())
+        self.assertEqual([str(i) for i in range(8)], [f.url for f in files])
+        self.assertEqual([b"oo"] * 8, [f.end_cache for f in files])
+        # All of the opens were outstanding at the same time.
+        self.assertEqual(8, r.max_in_flight)
+
+    def test_pessimist(self) -> None:
+        r = AsyncFixture()
+        r.should_raise_on_open_ended = "urllib"
+
+        async def inner() -> List[bytes]:
+            async with AsyncSeekableHttpFile(
+                "", get_range=r.aget_range, precache=2
+            ) as f:
+                self.assertEqual(3, f.length)
+                self.assertEqual(b"oo", f.end_cache)
+                self.assertEqual(3, f.stats["num_requests"])
+                return await f.read_many([(0, 1)])
+
+        self.assertEqual([b"fo"], asyncio.run(inner()))
+
+    def test_probe_length_range_ignored(self) -> None:
+        async def get_range(
+            url: str, t: Optional[str], method: Optional[str] = None
+        ) -> GeneralizedResponse:
+            return GeneralizedResponse(url, "3", None, None, b"foo")
+
+        async def inner() -> List[bytes]:
+            async with AsyncSeekableHttpFile("", get_range=get_range, precache=0) as f:
+                self.assertEqual(3, f.length)
+                self.assertEqual(1, f.stats["num_requests"])
+                return await f.read_many([(0, 2)])
+
+        self.assertEqual([b"foo"], asyncio.run(inner()))
+
+    def test_probe_length_empty(self) -> None:
+        async def get_range(
+            url: str, t: Optional[str], method: Optional[str] = None
+        ) -> GeneralizedResponse:
+            if method == "HEAD":
+                return GeneralizedResponse(url, "0", None, None, b"")
+            raise urllib.error.HTTPError(
+                code=416, url="", msg="", hdrs=None, fp=None  # type: ignore
+            )
+
+        async def inner(precache: int) -> None:
+            async with AsyncSeekableHttpFile(
+                "", get_range=get_range, precache=precache
+            ) as f:
+                self.assertEqual(0, f.length)
+                self.assertEqual(b"", f.end_cache)
+                # bytes=-N, then HEAD
+                self.assertEqual(2, f.stats["num_requests"])
+
+        for precache in (0, 256_000):
+            with self.subTest(precache=precache):
+                asyncio.run(inner(precache))
+        self.assertEqual(set(), _NO_SUFFIX_RANGE)
+
+    def test_read_many_past_end(self) -> None:
+        r = AsyncFixture()
+        self.assertEqual(
+            [b"oo", b""],
+            read_many("", [(1, 10), (5, 9)], get_range=r.aget_range, precache=1),
+        )
+
+    def test_etag_changes(self) -> None:
+        async def inner(check_etag: bool) -> List[bytes]:
+            r = AsyncFixture(etag="x")
+            async with AsyncSeekableHttpFile(
+                "", get_range=r.aget_range, precache=1, check_etag=check_etag
+            ) as f:
+                self.assertEqual("x", f.etag)
+                r.etag = "y"
+                return await f.read_many([(0, 0)])
+
+        with self.assertRaisesRegex(
+            EtagChangedError, "Previous etag was 'x', new one is 'y'"
+        ):
+            asyncio.run(inner(True))
+        self.assertEqual([b"f"], asyncio.run(inner(False)))
+
+    def test_sync_wrapper(self) -> None:
+        r = AsyncFixture(redir_url="z")
+        self.assertEqual(
+            [b"f", b"oo"],
+            read_many("", [(0, 0), (1, 2)], get_range=r.aget_range, precache=0),
+        )
+        self.assertEqual("z", r.last_fetched_url)
+
+    @unittest.skipIf(aiohttp is None, "aiohttp is not installed")
+    def test_failed_open_closes_session(self) -> None:
+        # Nothing listens on port 1, so the first request fails.
+        f = AsyncSeekableHttpFile("http://127.0.0.1:1/")
+
+        async def inner() -> None:
+            with self.assertRaises(aiohttp.ClientError):
+                async with f:
+                    pass
+
+        asyncio.run(inner())
+        self.assertIsNone(f._session)
@@ -1,20 +1,44 @@
+import http.client
 import io
 import json
+import os
+import threading
 import unittest
 import urllib.error
-from typing import Any, List, Optional
-from unittest.mock import Mock
+from concurrent.futures import Future
+from functools import partial
+from typing import Any, Callable, List, Optional, Tuple
+from unittest.mock import Mock, patch
 
 import requests.exceptions
 
 from seekablehttpfile import SeekableHttpFile
-from seekablehttpfile.core import EtagChangedError, GeneralizedResponse
+from seekablehttpfile.core import (
+    _CONNS,
+    _get_conn,
+    _NO_SUFFIX_RANGE,
+    _RangeCache,
+    _read_ranges_workers,
+    _request_keepalive,
+    close_all_connections,
+    EtagChangedError,
+    GeneralizedResponse,
+    get_range_httpx,
+    get_range_requests,
+    get_range_urllib3,
+    parse_content_range,
+)
 
 try:
     import keke
 except ImportError:
     keke = None  # type:ignore[assignment,unused-ignore]
 
+try:
+    import httpx
+except ImportError:
+    httpx = None  # type:ignore[assignment,unused-ignore]
+
 
 class Fixture:
     def __init__(
@@ -30,11 +54,12 @@ class Fixture:
         self, url: str, t: Optional[str], method: Optional[str] = "GET"
     ) -> GeneralizedResponse:
         self.last_fetched_url = url
+        size = len(self.x)
         if t is None:
             assert method == "HEAD"
             return GeneralizedResponse(
                 self.redir_url or url,
-                str(len(self.x)),
+                str(size),
                 None,
                 self.etag,
                 b"",
@@ -59,12 +84,12 @@ class Fixture:
                     raise Exception(
                         "should_raise_on_open_ended can only be (None, 'urllib', 'requests')"
                     )
-                start = max(0, len(self.x) - int(t[1:]))
-                end = len(self.x)
+                start = max(0, size - int(t[1:]))
+                end = size
             else:
                 start, end = map(int, t.split("-"))
                 end += 1  # Python half-open
-            t = f"bytes {start}-{end}/{len(self.x)}"
+            t = f"bytes {start}-{end}/{size}"
 
             return GeneralizedResponse(
                 self.redir_url or url,
@@ -75,7 +100,63 @@ class Fixture:
             )
 
 
+class IfMatchFixture(Fixture):
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.if_match: List[Optional[str]] = []
+
+    def get_range(
+        self,
+        url: str,
+        t: Optional[str],
+        method: Optional[str] = "GET",
+        if_match: Optional[str] = None,
+    ) -> GeneralizedResponse:
+        self.if_match.append(if_match)
+        if if_match is not None and if_match != self.etag:
+            raise urllib.error.HTTPError(
+                code=412,
+                url="",
+                msg="",
+                hdrs=None,  # type: ignore
+                fp=None,
+            )
+        return super().get_range(url, t, method)
+
+
+class SlowFixture(Fixture):
+    """
+    Counts concurrent requests.  Set `barrier` to hold each request until that
+    many are outstanding at once.
+    """
+
+    def __init__(self, *args: Any, **kwargs: Any) -> None:
+        super().__init__(*args, **kwargs)
+        self.lock = threading.Lock()
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.barrier: Optional[threading.Barrier] = None
+
+    def get_range(
+        self, url: str, t: Optional[str], method: Optional[str] = "GET"
+    ) -> GeneralizedResponse:
+        with self.lock:
+            self.in_flight += 1
+            self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        try:
+            if self.barrier is not None:
+                self.barrier.wait(timeout=5)
+            return super().get_range(url, t, method)
+        finally:
+            with self.lock:
+                self.in_flight -= 1
+
+
 class SeekableHttpFileTest(unittest.TestCase):
+    def setUp(self) -> None:
+        # Every test uses the same (empty) url.
+        _NO_SUFFIX_RANGE.clear()
+
     def test_smoke(self) -> None:
         r = Fixture()
         f = SeekableHttpFile("", get_range=r.get_range)
@@ -87,6 +168,27 @@ class SeekableHttpFileTest(unittest.TestCase):
         self.assertEqual(0, f.stats["lazy_bytes_read"])
         self.assertEqual(b"foo", f.end_cache)  # _optimistic_first_read
 
+    def test_complete(self) -> None:
+        r = Fixture()
+        f = SeekableHttpFile("", get_range=r.get_range)
+        self.assertEqual(f._read_complete, f.read)
+        self.assertEqual(b"f", f.read(1))
+        self.assertEqual(b"oo", f.read())
+        self.assertEqual(b"", f.read())
+        f.seek(-2, os.SEEK_END)
+        self.assertEqual(b"o", f.read(1))
+        self.assertEqual(1, f.stats["num_requests"])
+        self.assertEqual(3, f.stats["satisfied_from_cache"])
+
+        # The other ways in don't go to the network either.
+        f.seek(0)
+        buf = bytearray(3)
+        self.assertEqual(3, f.readinto(buf))
+        self.assertEqual(b"foo", buf)
+        self.assertEqual([b"fo", b"o"], f.read_ranges([(0, 2), (2, 5)]))
+        f.prefetch([(0, 2)])
+        self.assertEqual(1, f.stats["num_requests"])
+
     @unittest.skipIf(keke is None, "Keke is not installed")
     def test_smoke_keke(self) -> None:
         trace_output = io.StringIO()
@@ -101,25 +203,21 @@ class SeekableHttpFileTest(unittest.TestCase):
             self.assertEqual(1, f.stats["lazy_bytes_read"])
             self.assertEqual(b"oo", f.end_cache)  # _optimistic_first_read
 
-        # This will break if keke ever starts outputting protos.
-        events: List[Any] = []
-        for line in trace_output.getvalue().splitlines():
-            if line[:1] == "{":
-                events.append(json.loads(line[:-1]))  # skip trailing comma
-
-        matching_events = [
-            ev for ev in events if ev.get("name", "").startswith("SeekableHttpFile")
-        ]
-
-        self.assertEqual(2, len(matching_events))
+        # The trace is a complete JSON array once TraceOutput exits.  This
+        # will break if keke ever starts outputting protos.
+        events: List[Any] = json.loads(trace_output.getvalue())
 
         self.assertEqual(
-            "SeekableHttpFile._optimistic_first_read", matching_events[0]["name"]
+            [
+                ("SeekableHttpFile._optimistic_first_read", {}),
+                ("SeekableHttpFile.read", {"self.pos": "0", "n": "1"}),
+            ],
+            [
+                (ev["name"], ev["args"])
+                for ev in events
+                if ev.get("name", "").startswith("SeekableHttpFile")
+            ],
         )
-        self.assertEqual({}, matching_events[0]["args"])
-
-        self.assertEqual("SeekableHttpFile.read", matching_events[1]["name"])
-        self.assertEqual({"self.pos": "0", "n": "1"}, matching_events[1]["args"])
 
     def test_partially_cached(self) -> None:
         # edge case where it's only partially in end_cache
@@ -139,13 +237,164 @@ class SeekableHttpFileTest(unittest.TestCase):
         f = SeekableHttpFile("", get_range=r.get_range, precache=0)
         self.assertEqual(0, f.pos)
         self.assertEqual(3, f.length)
-        self.assertEqual(1, f.stats["num_requests"])
-        self.assertEqual(b"f", f.read(1))
+        # bytes=-1, then HEAD
         self.assertEqual(2, f.stats["num_requests"])
+        self.assertEqual(b"f", f.read(1))
+        self.assertEqual(3, f.stats["num_requests"])
         self.assertEqual(0, f.stats["optimistic_bytes_read"])
         self.assertEqual(1, f.stats["lazy_bytes_read"])
         self.assertEqual(b"", f.end_cache)
 
+    def test_not_found_fails_fast(self) -> None:
+        for error in (
+            urllib.error.HTTPError(
+                code=404, url="", msg="", hdrs=None, fp=None  # type: ignore
+            ),
+            requests.exceptions.HTTPError(
+                request=Mock(), response=Mock(status_code=404)
+            ),
+        ):
+            with self.subTest(error=type(error)):
+                get_range = Mock(side_effect=error)
+                with self.assertRaises(type(error)):
+                    SeekableHttpFile("", get_range=get_range)
+                # No HEAD after the suffix range fails.
+                self.assertEqual(1, get_range.call_count)
+
+    def test_pessimist_open_single_rtt(self) -> None:
+        r = Fixture()
+        r.should_raise_on_open_ended = "urllib"
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        # bytes=-10, then bytes=0-9 which turns out to be all of it
+        self.assertEqual(2, f.stats["num_requests"])
+        self.assertEqual(b"foo", f.end_cache)
+        self.assertEqual(b"foo", f.read())
+        self.assertEqual(2, f.stats["num_requests"])
+
+        # Once the host is known not to support suffix ranges, opening is one
+        # request.
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        self.assertEqual(1, f.stats["num_requests"])
+        self.assertEqual(3, f.length)
+
+    def test_pessimist_head_cached(self) -> None:
+        r = Fixture()
+        r.should_raise_on_open_ended = "urllib"
+        r.x = bytes(range(256)) * 100
+        f = SeekableHttpFile("", get_range=r.get_range, precache=100)
+        self.assertEqual(3, f.stats["num_requests"])
+        self.assertEqual(r.x[-100:], f.end_cache)
+        self.assertEqual(r.x[:30], f.read(30))
+        self.assertEqual(3, f.stats["num_requests"])
+
+    def test_concurrent_probe(self) -> None:
+        r = SlowFixture()
+        r.should_raise_on_open_ended = "urllib"
+        r.barrier = threading.Barrier(2)
+        f = SeekableHttpFile("", get_range=r.get_range, concurrent_probe=True)
+        # bytes=-256000 and bytes=0-255999 at the same time
+        self.assertEqual(2, r.max_in_flight)
+        self.assertEqual(2, f.stats["num_requests"])
+        self.assertEqual(b"foo", f.read())
+        f.close()
+
+    def test_concurrent_probe_unneeded(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 100
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precache=100, concurrent_probe=True
+        )
+        assert f._executor is not None
+        f._executor.shutdown(wait=True)
+        self.assertEqual(2, f.stats["num_requests"])
+        self.assertEqual(200, f.stats["optimistic_bytes_read"])
+        # The head it fetched anyway is kept.
+        self.assertEqual(r.x[:10], f.read(10))
+        self.assertEqual(2, f.stats["num_requests"])
+
+    def test_pessimist_remembers_host(self) -> None:
+        r = Fixture()
+        r.should_raise_on_open_ended = "urllib"
+        f = SeekableHttpFile("http://example.com/a", get_range=r.get_range, precache=0)
+        self.assertEqual(2, f.stats["num_requests"])
+        # The second file on that host doesn't try bytes=-1 again.
+        f = SeekableHttpFile("http://example.com/b", get_range=r.get_range, precache=0)
+        self.assertEqual(1, f.stats["num_requests"])
+        self.assertEqual(3, f.length)
+        # Other hosts still do.
+        f = SeekableHttpFile("http://example.org/a", get_range=r.get_range, precache=0)
+        self.assertEqual(2, f.stats["num_requests"])
+
+    def test_precomputed(self) -> None:
+        r = Fixture()
+        r.x = b"foobar"
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precomputed_length=6, precomputed_tail=b"bar"
+        )
+        self.assertEqual(0, f.stats["num_requests"])
+        self.assertEqual(3, f.end_cache_start)
+        f.seek(-2, os.SEEK_END)
+        self.assertEqual(b"ar", f.read())
+        self.assertEqual(0, f.stats["num_requests"])
+        f.seek(0)
+        self.assertEqual(b"foo", f.read(3))
+        self.assertEqual(1, f.stats["num_requests"])
+
+        # The whole file is as good as a complete first read.
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precomputed_length=3, precomputed_tail=b"foo"
+        )
+        self.assertEqual(f._read_complete, f.read)
+
+        # Length alone is like precache=0.
+        f = SeekableHttpFile("", get_range=r.get_range, precomputed_length=6)
+        self.assertEqual(b"foobar", f.read())
+        self.assertEqual(1, f.stats["num_requests"])
+
+        with self.assertRaises(ValueError):
+            SeekableHttpFile("", get_range=r.get_range, precomputed_tail=b"bar")
+        with self.assertRaises(ValueError):
+            SeekableHttpFile(
+                "", get_range=r.get_range, precomputed_length=2, precomputed_tail=b"bar"
+            )
+
+    def test_probe_length(self) -> None:
+        r = Fixture()
+        f = SeekableHttpFile("", get_range=r.get_range, precache=0)
+        self.assertEqual(3, f.length)
+        self.assertEqual(1, f.stats["num_requests"])
+        self.assertEqual(b"o", f.end_cache)
+        self.assertEqual(2, f.end_cache_start)
+        self.assertEqual(b"fo", f.read(2))
+        self.assertEqual(b"o", f.read(1))
+        self.assertEqual(2, f.stats["num_requests"])
+
+    def test_probe_length_range_ignored(self) -> None:
+        get_range = Mock(return_value=GeneralizedResponse("", "3", None, None, b"foo"))
+        f = SeekableHttpFile("", get_range=get_range, precache=0)
+        self.assertEqual(3, f.length)
+        self.assertEqual(b"foo", f.read())
+        self.assertEqual(1, f.stats["num_requests"])
+
+    def test_probe_length_empty(self) -> None:
+        def get_range(
+            url: str, t: Optional[str], method: Optional[str] = None
+        ) -> GeneralizedResponse:
+            if method == "HEAD":
+                return GeneralizedResponse(url, "0", None, None, b"")
+            raise urllib.error.HTTPError(
+                code=416, url="", msg="", hdrs=None, fp=None  # type: ignore
+            )
+
+        for precache in (0, 256_000):
+            with self.subTest(precache=precache):
+                f = SeekableHttpFile("", get_range=get_range, precache=precache)
+                self.assertEqual(0, f.length)
+                self.assertEqual(b"", f.read())
+                # bytes=-N, then HEAD
+                self.assertEqual(2, f.stats["num_requests"])
+                self.assertEqual(set(), _NO_SUFFIX_RANGE)
+
     def test_short_read(self) -> None:
         r = Fixture()
         r.should_raise_on_open_ended = "urllib"
@@ -156,10 +405,24 @@ class SeekableHttpFileTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             f.read(3)
         self.assertEqual(4, f.stats["num_requests"])
-        self.assertEqual(2, f.stats["optimistic_bytes_read"])
+        # Both the head and the tail
+        self.assertEqual(4, f.stats["optimistic_bytes_read"])
         self.assertEqual(3, f.stats["lazy_bytes_read"])
         self.assertEqual(b"oo", f.end_cache)  # _head
 
+    def test_read_error_keeps_position(self) -> None:
+        r = Fixture()
+        r.x = b"foobarbaz"
+        f = SeekableHttpFile("", get_range=r.get_range, precache=2)
+        get_range = f.get_range
+        f.get_range = Mock(side_effect=ConnectionError)
+        with self.assertRaises(ConnectionError):
+            f.read(5)
+        self.assertEqual(0, f.tell())
+        f.get_range = get_range
+        self.assertEqual(b"fooba", f.read(5))
+        self.assertEqual(5, f.tell())
+
     def test_short_read_requests(self) -> None:
         r = Fixture()
         r.should_raise_on_open_ended = "requests"
@@ -170,7 +433,8 @@ class SeekableHttpFileTest(unittest.TestCase):
         with self.assertRaises(ValueError):
             f.read(3)
         self.assertEqual(4, f.stats["num_requests"])
-        self.assertEqual(2, f.stats["optimistic_bytes_read"])
+        # Both the head and the tail
+        self.assertEqual(4, f.stats["optimistic_bytes_read"])
         self.assertEqual(3, f.stats["lazy_bytes_read"])
         self.assertEqual(b"oo", f.end_cache)  # _head
 
@@ -219,3 +483,562 @@ class SeekableHttpFileTest(unittest.TestCase):
         f.read(1)
         # Not an error
         self.assertEqual("x", f.etag)
+
+    def test_session_is_threaded(self) -> None:
+        session = Mock()
+        resp = session.request.return_value = Mock(
+            url="z",
+            headers={"content-length": "3", "content-range": "bytes 0-2/3"},
+        )
+        resp.raw.read.return_value = b"foo"
+        f = SeekableHttpFile("", get_range=get_range_requests, session=session)
+        self.assertEqual(b"foo", f.read())
+        self.assertEqual(1, session.request.call_count)
+        self.assertEqual(
+            {"Range": "bytes=-256000"}, session.request.call_args[1]["headers"]
+        )
+        self.assertTrue(session.request.call_args[1]["stream"])
+        resp.close.assert_called_once_with()
+
+    def test_session_without_get_range_support(self) -> None:
+        session = Mock()
+        get_ranges: List[Callable[..., GeneralizedResponse]] = [
+            get_range_urllib3,
+            Fixture().get_range,
+        ]
+        for get_range in get_ranges:
+            with self.subTest(get_range=get_range):
+                with self.assertRaisesRegex(ValueError, "session="):
+                    SeekableHttpFile("", get_range=get_range, session=session)
+        session.request.assert_not_called()
+
+    @unittest.skipIf(httpx is None, "httpx is not installed")
+    def test_httpx_unsupported_range(self) -> None:
+        seen: List[Optional[str]] = []
+
+        def handler(request: "httpx.Request") -> "httpx.Response":
+            rng = request.headers.get("range")
+            seen.append(rng)
+            if request.method == "HEAD":
+                return httpx.Response(200, headers={"content-length": "3"})
+            elif rng.startswith("bytes=-"):
+                return httpx.Response(501)
+            start, end = map(int, rng[6:].split("-"))
+            end = min(end, 2)
+            return httpx.Response(
+                206,
+                headers={"content-range": f"bytes {start}-{end}/3"},
+                content=b"foo"[start : end + 1],
+            )
+
+        client = httpx.Client(transport=httpx.MockTransport(handler))
+        f = SeekableHttpFile(
+            "http://example.com/", get_range=partial(get_range_httpx, client=client)
+        )
+        self.assertEqual(3, f.length)
+        self.assertEqual(b"foo", f.read())
+        # The file is smaller than precache, so it was read in one go.
+        self.assertEqual(["bytes=-256000", "bytes=0-255999"], seen)
+
+    def test_prefetch_coalesces(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 1000
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        self.assertEqual(1, f.stats["num_requests"])
+        f.prefetch([(100, 109), (0, 9), (200000, 200009), (255995, 255999)])
+        # The first two merge, the third is alone, and the last is already in
+        # the end cache.
+        self.assertEqual(3, f.stats["num_requests"])
+        self.assertEqual(120, f.stats["lazy_bytes_read"])
+
+        f.seek(100)
+        self.assertEqual(r.x[100:110], f.read(10))
+        f.seek(50)
+        self.assertEqual(r.x[50:60], f.read(10))
+        f.seek(200000)
+        self.assertEqual(r.x[200000:200010], f.read(10))
+        self.assertEqual(3, f.stats["num_requests"])
+        self.assertEqual(3, f.stats["satisfied_from_cache"])
+
+        # Partially covered is a miss.
+        f.seek(200005)
+        self.assertEqual(r.x[200005:200015], f.read(10))
+        self.assertEqual(4, f.stats["num_requests"])
+
+    def test_prefetch_bounded(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 1000
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precache=10, range_cache_bytes=1000
+        )
+        starts = [i * 300 for i in range(5)]
+        f.prefetch([(start, start + 9) for start in starts])
+        # Merging stops at half the range cache: 0-309, 600-909 and 1200-1209
+        self.assertEqual(4, f.stats["num_requests"])
+        self.assertEqual(630, f.stats["lazy_bytes_read"])
+        for start in starts:
+            f.seek(start)
+            self.assertEqual(r.x[start : start + 10], f.read(10))
+        self.assertEqual(4, f.stats["num_requests"])
+
+        # Already cached, so nothing is fetched.
+        f.prefetch([(305, 308), (650, 700)])
+        self.assertEqual(4, f.stats["num_requests"])
+
+    def test_read_ranges(self) -> None:
+        r = SlowFixture()
+        r.x = bytes(range(256)) * 1000
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        r.barrier = threading.Barrier(3)
+        ranges = [(0, 12), (1000, 5), (255995, 5), (300000, 10), (5000, 20)]
+        self.assertEqual(
+            [r.x[0:12], r.x[1000:1005], r.x[255995:], b"", r.x[5000:5020]],
+            f.read_ranges(ranges),
+        )
+        # The three misses were outstanding at the same time.
+        self.assertEqual(3, r.max_in_flight)
+        self.assertEqual(4, f.stats["num_requests"])
+        self.assertEqual(0, f.tell())
+
+        # Now they're all cached.
+        self.assertEqual([r.x[1000:1005]], f.read_ranges([(1000, 5)]))
+        self.assertEqual(4, f.stats["num_requests"])
+
+        r.barrier = None
+        r.max_in_flight = 0
+        f.read_ranges([(10000, 1), (20000, 1), (30000, 1)], max_workers=1)
+        self.assertEqual(1, r.max_in_flight)
+
+    def test_read_ranges_workers_env(self) -> None:
+        r = SlowFixture()
+        r.x = bytes(range(256)) * 1000
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        # Two at a time, or more would be in flight.
+        r.barrier = threading.Barrier(2)
+        with patch.dict(os.environ, {"SEEKABLEHTTPFILE_WORKERS": "2"}):
+            f.read_ranges([(10000, 1), (20000, 1), (30000, 1), (40000, 1)])
+        self.assertEqual(2, r.max_in_flight)
+
+        for bad in ("0", "-1", "eight", ""):
+            with patch.dict(os.environ, {"SEEKABLEHTTPFILE_WORKERS": bad}):
+                self.assertEqual(8, _read_ranges_workers())
+
+    def test_readahead(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 4096  # 1MiB
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        buf = []
+        for i in range(4096):
+            buf.append(f.read(100))
+        self.assertEqual(r.x[:409600], b"".join(buf))
+        # 1 + exact + 64K + 128K + 256K
+        self.assertEqual(5, f.stats["num_requests"])
+
+        # Random access is fetched exactly, and resets the window.
+        f.seek(900_000)
+        self.assertEqual(r.x[900_000:900_100], f.read(100))
+        self.assertEqual(6, f.stats["num_requests"])
+        self.assertEqual(r.x[900_100:900_200], f.read(100))
+        self.assertEqual(7, f.stats["num_requests"])
+        self.assertEqual(64 * 1024, len(f._readahead))
+
+        # The readahead stops short of the end cache.
+        f.seek(-1010, 2)
+        f.read(100)
+        f.read(100)
+        self.assertEqual(900, len(f._readahead))
+
+    def test_forward_skip(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 16384  # 4MiB
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        f.read(100)
+        f.read(100)
+        self.assertEqual(64 * 1024, f._readahead_window)
+
+        # Skipping to a read that straddles the end of the readahead keeps the
+        # stream going, but doesn't grow the window.
+        f.seek(65_600)
+        self.assertEqual(r.x[65_600:65_700], f.read(100))
+        self.assertEqual(64 * 1024, f._readahead_window)
+        self.assertEqual(65_600 - 200, f.stats["forward_skip_bytes"])
+
+        # Past the readahead is random access again.
+        f.seek(500_000)
+        self.assertEqual(r.x[500_000:500_100], f.read(100))
+        self.assertEqual(0, f._readahead_window)
+        self.assertEqual(65_600 - 200, f.stats["forward_skip_bytes"])
+
+    def test_strided_reads_exact(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 65536  # 16MiB
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        for i in range(12):
+            f.seek(i * 900_000)
+            self.assertEqual(r.x[i * 900_000 : i * 900_000 + 30], f.read(30))
+        # Small scattered reads (like zip local headers) don't read ahead.
+        self.assertEqual(12 * 30, f.stats["lazy_bytes_read"])
+
+    def test_forward_skip_background(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 16384  # 4MiB
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precache=10, background_readahead=True
+        )
+        try:
+            f.read(100)
+            f.read(100)
+            assert f._pending is not None
+            self.assertEqual(100 + 64 * 1024, f._pending[0])
+            f._pending[2].result()
+            self.assertEqual(4, f.stats["num_requests"])
+            # Landing inside the pending window uses it instead of refetching.
+            f.seek(100_000)
+            self.assertEqual(r.x[100_000:100_100], f.read(100))
+            assert f._pending is not None
+            f._pending[2].result()
+            # and queues up the next one
+            self.assertEqual(5, f.stats["num_requests"])
+        finally:
+            f.close()
+
+    def test_sequential_grows(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 1000
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        for i in range(100):
+            self.assertEqual(r.x[i : i + 1], f.read(1))
+        # 1 + exact + 64K
+        self.assertEqual(3, f.stats["num_requests"])
+
+    def test_background_readahead(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 4096  # 1MiB
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precache=10, background_readahead=True
+        )
+        try:
+            buf = []
+            for i in range(4096):
+                buf.append(f.read(100))
+            self.assertEqual(r.x[:409600], b"".join(buf))
+            assert f._pending is not None
+            f._pending[2].result()
+            # 1 + exact + 64K, then the next 64K, 128K and 256K windows came
+            # from the background, and the 512K one is still pending.
+            self.assertEqual(7, f.stats["num_requests"])
+
+            # A jump elsewhere drops it.
+            f.seek(600_000)
+            self.assertEqual(r.x[600_000:600_010], f.read(10))
+            self.assertIsNone(f._pending)
+        finally:
+            f.close()
+        self.assertIsNone(f._executor)
+
+    def test_readinto(self) -> None:
+        r = Fixture()
+        r.x = b"foobar"
+        f = SeekableHttpFile("", get_range=r.get_range, precache=3)
+        buf = bytearray(4)
+        self.assertEqual(4, f.readinto(buf))
+        self.assertEqual(b"foob", buf)
+        self.assertEqual(2, f.stats["num_requests"])
+        self.assertEqual(2, f.readinto(buf))
+        self.assertEqual(b"arob", buf)
+        self.assertEqual(1, f.stats["satisfied_from_cache"])
+        self.assertEqual(0, f.readinto(buf))
+        self.assertEqual(b"bar", f.getbuffer())
+        self.assertTrue(f.getbuffer().readonly)
+
+    def test_readinto_readahead(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 1000
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+        buf = bytearray(10)
+        for i in range(0, 1000, 10):
+            self.assertEqual(10, f.readinto(buf))
+            self.assertEqual(r.x[i : i + 10], buf)
+        # 1 + exact + 64K
+        self.assertEqual(3, f.stats["num_requests"])
+        self.assertEqual(98, f.stats["satisfied_from_cache"])
+
+    def test_close_all_connections(self) -> None:
+        _lock, conn = _get_conn("http", "example.invalid", 80)
+        self.assertIs(conn, _get_conn("http", "example.invalid", 80)[1])
+        close_all_connections()
+        self.assertEqual({}, _CONNS)
+        self.assertIsNot(conn, _get_conn("http", "example.invalid", 80)[1])
+        close_all_connections()
+
+    def test_keepalive_read_error_closes(self) -> None:
+        conn = Mock()
+        conn.getresponse.return_value.read.side_effect = http.client.IncompleteRead(b"")
+        _CONNS[("http", "example.invalid", 80)] = (threading.Lock(), conn)
+        try:
+            with self.assertRaises(http.client.IncompleteRead):
+                _request_keepalive("http://example.invalid/", "GET", {})
+            conn.close.assert_called_once_with()
+        finally:
+            close_all_connections()
+
+    def test_parse_content_range(self) -> None:
+        self.assertEqual((0, 99, 1000), parse_content_range("bytes 0-99/1000"))
+        for bad in ("bytes */1000", "bytes 0-99/*", "items 0-1/2", ""):
+            with self.subTest(bad):
+                with self.assertRaises(ValueError):
+                    parse_content_range(bad)
+
+    def test_range_cache_lru(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 100
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precache=10, range_cache_bytes=25
+        )
+        for start in (0, 100, 0, 200, 0, 100):
+            f.seek(start)
+            self.assertEqual(r.x[start : start + 10], f.read(10))
+        # 100 was evicted by 200, since 0 had been used more recently.
+        self.assertEqual(5, f.stats["num_requests"])
+        self.assertEqual(2, f.stats["satisfied_from_cache"])
+
+    def test_range_cache_nested(self) -> None:
+        data = bytes(range(256)) * 40
+        for order in ([(0, 10_000), (100, 10)], [(100, 10), (0, 10_000)]):
+            with self.subTest(order=order):
+                cache = _RangeCache()
+                for start, n in order:
+                    cache.add(start, data[start : start + n])
+                # Only the outer range is kept, and it's found from inside.
+                self.assertEqual([0], cache._starts)
+                self.assertEqual(10_000, cache._bytes)
+                self.assertEqual(data[105:155], cache.get(105, 50))
+
+    def test_range_cache_skips_bulk_reads(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 16384  # 4MiB
+        f = SeekableHttpFile(
+            "", get_range=r.get_range, precache=10, range_cache_bytes=25
+        )
+        f.seek(0)
+        self.assertEqual(r.x[:10], f.read(10))
+        # More than half the cache, so it doesn't evict the range at 0.
+        f.seek(2_200_000)
+        self.assertEqual(r.x[2_200_000:2_200_020], f.read(20))
+        f.seek(0)
+        self.assertEqual(r.x[:10], f.read(10))
+        self.assertEqual(3, f.stats["num_requests"])
+        self.assertEqual(1, f.stats["satisfied_from_cache"])
+
+        # The same goes for read_ranges and prefetch.
+        self.assertEqual([r.x[3_000_000:3_000_020]], f.read_ranges([(3_000_000, 20)]))
+        f.prefetch([(3_500_000, 3_500_019)])
+        f.seek(0)
+        self.assertEqual(r.x[:10], f.read(10))
+        self.assertEqual(5, f.stats["num_requests"])
+        self.assertEqual(2, f.stats["satisfied_from_cache"])
+
+    def test_lru_rereads_head(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 4000
+        f = SeekableHttpFile("", get_range=r.get_range)
+        f.seek(0)
+        self.assertEqual(r.x[:10], f.read(10))
+        f.seek(-10, os.SEEK_END)
+        self.assertEqual(r.x[-10:], f.read(10))
+        f.seek(0)
+        self.assertEqual(r.x[:10], f.read(10))
+        self.assertEqual(2, f.stats["num_requests"])
+        self.assertEqual(2, f.stats["satisfied_from_cache"])
+
+    def wait_for_single_flight(
+        self, f: SeekableHttpFile, count: int
+    ) -> Callable[[], None]:
+        """
+        Returns a function that blocks until `count` fetches have found another
+        fetch of the same range in flight (and so will wait for its result).
+        """
+        found = threading.Semaphore(0)
+        find_inflight = f._find_inflight
+
+        def counting_find_inflight(
+            start: int, n: int
+        ) -> Optional[Tuple[int, "Future[bytes]"]]:
+            waiting = find_inflight(start, n)
+            if waiting is not None:
+                found.release()
+            return waiting
+
+        f._find_inflight = counting_find_inflight  # type: ignore[method-assign]
+
+        def wait() -> None:
+            for _ in range(count):
+                self.assertTrue(found.acquire(timeout=5))
+
+        return wait
+
+    def test_single_flight(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 100
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+
+        started = threading.Event()
+        release = threading.Event()
+        get_range = r.get_range
+
+        def slow_get_range(
+            url: str, t: Optional[str], method: Optional[str] = "GET"
+        ) -> GeneralizedResponse:
+            started.set()
+            release.wait()
+            return get_range(url, t, method)
+
+        f.get_range = slow_get_range
+        wait = self.wait_for_single_flight(f, 1)
+        threads = [
+            threading.Thread(target=f.prefetch, args=([(0, 99)],)),
+            threading.Thread(target=f.prefetch, args=([(10, 19)],)),
+        ]
+        threads[0].start()
+        started.wait()
+        threads[1].start()
+        wait()
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual(2, f.stats["num_requests"])
+        self.assertEqual({}, f._inflight)
+
+    def test_single_flight_identical(self) -> None:
+        r = Fixture()
+        r.x = bytes(range(256)) * 100
+        f = SeekableHttpFile("", get_range=r.get_range, precache=10)
+
+        started = threading.Event()
+        release = threading.Event()
+        get_range = r.get_range
+
+        def slow_get_range(
+            url: str, t: Optional[str], method: Optional[str] = "GET"
+        ) -> GeneralizedResponse:
+            started.set()
+            release.wait()
+            return get_range(url, t, method)
+
+        f.get_range = slow_get_range
+        wait = self.wait_for_single_flight(f, 3)
+        results: List[List[bytes]] = []
+        threads = [
+            threading.Thread(target=lambda: results.append(f.read_ranges([(0, 10)])))
+            for _ in range(4)
+        ]
+        threads[0].start()
+        started.wait()
+        for t in threads[1:]:
+            t.start()
+        wait()
+        release.set()
+        for t in threads:
+            t.join()
+
+        self.assertEqual([[r.x[:10]]] * 4, results)
+        self.assertEqual(2, f.stats["num_requests"])
+
+    def test_seek(self) -> None:
+        r = Fixture()
+        f = SeekableHttpFile("", get_range=r.get_range)
+        f.seek(1)
+        self.assertEqual(1, f.tell())
+        f.seek(1, os.SEEK_CUR)
+        self.assertEqual(2, f.tell())
+        f.seek(-3, os.SEEK_END)
+        self.assertEqual(0, f.tell())
+        for whence in (-1, 3):
+            with self.assertRaises(ValueError):
+                f.seek(0, whence)
+        # Past the end reads nothing, on both read paths.
+        f.seek(10)
+        self.assertEqual(b"", f.read())
+        self.assertEqual(10, f.tell())
+        f = SeekableHttpFile("", get_range=r.get_range, precache=1)
+        f.seek(10)
+        self.assertEqual(b"", f.read())
+        f.seek(0)
+        self.assertEqual(b"", f.read(0))
+        self.assertEqual(1, f.stats["num_requests"])
+
+    def test_buffered_reader(self) -> None:
+        r = Fixture()
+        r.x = b"foobar"
+        with SeekableHttpFile("", get_range=r.get_range, precache=3) as f:
+            self.assertIsInstance(f, io.RawIOBase)
+            self.assertTrue(f.readable())
+            b = io.BufferedReader(f)
+            self.assertEqual(b"fo", b.read(2))
+            self.assertEqual(4, b.seek(-2, os.SEEK_END))
+            self.assertEqual(b"ar", b.read())
+            # readall() asks the raw file for more than is left.
+            b.seek(0)
+            self.assertEqual(b"foobar", b.read())
+            f.seek(2)
+            self.assertEqual(b"obar", f.read(100))
+            self.assertEqual(6, f.tell())
+            self.assertEqual(b"", f.read(100))
+        self.assertTrue(f.closed)
+
+    def test_urllib3(self) -> None:
+        pool = Mock()
+        resp = pool.request.return_value = Mock(
+            status=206,
+            headers={"content-length": "3", "content-range": "bytes 0-2/3"},
+        )
+        resp.retries.history = (Mock(url="http://a/r", redirect_location="/x"),)
+        resp.read.return_value = b"foo"
+        f = SeekableHttpFile(
+            "http://a/r", get_range=partial(get_range_urllib3, pool=pool)
+        )
+        self.assertEqual("http://a/x", f.url)
+        self.assertEqual(b"foo", f.read())
+        self.assertEqual(
+            {"Range": "bytes=-256000"}, pool.request.call_args[1]["headers"]
+        )
+        resp.release_conn.assert_called_once_with()
+
+        resp.status = 404
+        with self.assertRaises(urllib.error.HTTPError) as cm:
+            get_range_urllib3("http://a/", None, pool=pool)
+        self.assertEqual(404, cm.exception.code)
+
+    def test_etag_if_match(self) -> None:
+        r = IfMatchFixture(etag="x")
+        f = SeekableHttpFile("", get_range=r.get_range, precache=1)
+        f.read(1)
+        r.etag = "y"
+        with self.assertRaisesRegex(
+            EtagChangedError, "Previous etag was 'x', server no longer matches"
+        ):
+            f.read(1)
+        self.assertEqual([None, "x", "x"], r.if_match)
+
+    def test_etag_if_match_weak(self) -> None:
+        r = IfMatchFixture(etag='W/"x"')
+        f = SeekableHttpFile("", get_range=r.get_range, precache=1)
+        f.read(1)
+        self.assertEqual([None, None], r.if_match)
+
+    def test_etag_if_match_disabled(self) -> None:
+        r = IfMatchFixture(etag="x")
+        f = SeekableHttpFile("", get_range=r.get_range, precache=1, check_etag=False)
+        f.read(1)
+        self.assertEqual([None, None], r.if_match)
+
+    def test_etag_if_match_get_range_replaced(self) -> None:
+        r = IfMatchFixture(etag="x")
+        f = SeekableHttpFile("", get_range=r.get_range, precache=1)
+        # This one doesn't take if_match.
+        f.get_range = Fixture(etag="x").get_range
+        self.assertEqual(b"f", f.read(1))
+        f.get_range = r.get_range
+        self.assertEqual(b"o", f.read(1))
+        self.assertEqual([None, "x"], r.if_match)
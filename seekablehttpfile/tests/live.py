@@ -2,25 +2,61 @@ import io
 import json
 import os
 import unittest
-import urllib.error
-from typing import Any, List
+from typing import Any, Callable, List, Type, TYPE_CHECKING
+from urllib.error import HTTPError
 
 import requests.exceptions
 
 from seekablehttpfile import SeekableHttpFile
-from seekablehttpfile.core import get_range_requests
+from seekablehttpfile.core import (
+    _NO_SUFFIX_RANGE,
+    GeneralizedResponse,
+    get_range_httpx,
+    get_range_requests,
+    get_range_urllib3,
+    get_range_urlopen,
+)
 
 try:
     import keke
 except ImportError:
     keke = None  # type:ignore[assignment,unused-ignore]
 
+try:
+    import httpx
+except ImportError:
+    httpx = None  # type:ignore[assignment,unused-ignore]
+
 SAMPLE_FILE = "https://files.pythonhosted.org/packages/86/ea/f27b648330abff7d07faf03f2dbe8070630d2a14b79185f165d555447071/seekablehttpfile-0.0.4-py3-none-any.whl"
 
+# These need the internet, so they only run when asked for (make test-live).
+LIVE = bool(os.environ.get("SEEKABLEHTTPFILE_LIVE_TESTS"))
+live = unittest.skipUnless(LIVE, "set SEEKABLEHTTPFILE_LIVE_TESTS=1 to run")
+
+if TYPE_CHECKING:
+    _Base = unittest.TestCase
+else:
+    _Base = object
 
+
+@live
 class LiveTests(unittest.TestCase):
     """These tests all require internet access."""
 
+    pypi_file: SeekableHttpFile
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        _NO_SUFFIX_RANGE.clear()
+        # Opened once for the tests that only need to trace reads.
+        cls.pypi_file = SeekableHttpFile(
+            SAMPLE_FILE, get_range=get_range_urlopen, precache=1024
+        )
+
+    def setUp(self) -> None:
+        # test_live_pypi_keke_open expects to see the suffix range attempted.
+        _NO_SUFFIX_RANGE.clear()
+
     def test_live_synthetic(self) -> None:
         f = SeekableHttpFile("http://timhatch.com/projects/http-tests/sequence_100.txt")
         self.assertEqual(0, f.pos)
@@ -38,30 +74,74 @@ class LiveTests(unittest.TestCase):
         f.seek(2, 1)
         self.assertEqual(3, f.pos)
 
-        # tests the read doing a fetch
+        # tests the read doing a fetch (the whole file fits in the default
+        # precache, and then read() never looks at end_cache_start)
+        f = SeekableHttpFile(
+            "http://timhatch.com/projects/http-tests/sequence_100.txt", precache=10
+        )
         f.seek(-4, 2)
         f.end_cache_start = f.length
         self.assertEqual(b"100\n", f.read(4))
+        self.assertEqual(2, f.stats["num_requests"])
 
         # errors
         with self.assertRaises(ValueError):
             f.seek(0, 99)
 
-    def test_live_404(self) -> None:
-        with self.assertRaises(urllib.error.HTTPError):
-            SeekableHttpFile(
-                "http://timhatch.com/projects/http-tests/response/?code=404"
-            )
+    def traced_ranges(self, func: Callable[[], Any]) -> List[Any]:
+        trace_output = io.StringIO()
+        with keke.TraceOutput(file=trace_output, close_output_file=False):
+            func()
+
+        # The trace is a complete JSON array once TraceOutput exits.  This
+        # will break if keke ever starts outputting protos.
+        events: List[Any] = json.loads(trace_output.getvalue())
+        return [ev["args"] for ev in events if ev.get("name") == "get_range_urlopen"]
+
+    @unittest.skipIf(keke is None, "Keke is not installed")
+    def test_live_pypi_keke_open(self) -> None:
+        # The central directory of this wheel fits in the last 1KiB, so
+        # there's no need for the default 256KB.
+        self.assertEqual(
+            [{"content_range": "bytes=-1024", "method": "None"}],
+            self.traced_ranges(
+                lambda: SeekableHttpFile(
+                    SAMPLE_FILE, get_range=get_range_urlopen, precache=1024
+                )
+            ),
+        )
+
+    @unittest.skipIf(keke is None, "Keke is not installed")
+    def test_live_pypi_keke_read(self) -> None:
+        f = self.pypi_file
+        f.seek(0, os.SEEK_SET)
+        self.assertEqual(
+            [{"content_range": "bytes=0-11", "method": "None"}],
+            self.traced_ranges(lambda: f.read(12)),
+        )
+
+
+class LiveBackendTests(_Base):
+    """
+    Tests that depend on the transport, mixed into one TestCase per backend
+    below.  These also require internet access.
+    """
+
+    get_range: Callable[..., GeneralizedResponse]
+    status_error: Type[Exception]
 
-    def test_live_404_requests(self) -> None:
-        with self.assertRaises(requests.exceptions.HTTPError):
+    def setUp(self) -> None:
+        _NO_SUFFIX_RANGE.clear()
+
+    def test_live_404(self) -> None:
+        with self.assertRaises(self.status_error):
             SeekableHttpFile(
                 "http://timhatch.com/projects/http-tests/response/?code=404",
-                get_range=get_range_requests,
+                get_range=self.get_range,
             )
 
     def test_live_pypi(self) -> None:
-        f = SeekableHttpFile(SAMPLE_FILE)
+        f = SeekableHttpFile(SAMPLE_FILE, get_range=self.get_range)
         f.seek(0, os.SEEK_SET)
         f.read(12)
         f.seek(-10, os.SEEK_END)
@@ -69,49 +149,32 @@ class LiveTests(unittest.TestCase):
         self.assertEqual(b"", f.read(2))
         f.seek(-10, os.SEEK_END)
         f.read(12)
-        self.assertEqual(4, f.stats["satisfied_from_cache"])
+        # The read at EOF doesn't count
+        self.assertEqual(3, f.stats["satisfied_from_cache"])
         self.assertEqual(0, f.stats["lazy_bytes_read"])
 
-    @unittest.skipIf(keke is None, "Keke is not installed")
-    def test_live_pypi_keke(self) -> None:
-        trace_output = io.StringIO()
-        with keke.TraceOutput(file=trace_output, close_output_file=False):
-            f = SeekableHttpFile(SAMPLE_FILE)
-            f.seek(0, os.SEEK_SET)
-            f.read(12)
-
-        # This will break if keke ever starts outputting protos.
-        events: List[Any] = []
-        for line in trace_output.getvalue().splitlines():
-            if line[:1] == "{":
-                events.append(json.loads(line[:-1]))  # skip trailing comma
-
-        matching_events = [
-            ev for ev in events if ev.get("name", "") == "get_range_urlopen"
-        ]
-        self.assertEqual(3, len(matching_events))
-        self.assertEqual(
-            {"content_range": "bytes=-256000", "method": "None"},
-            matching_events[0]["args"],
-        )
-        self.assertEqual(
-            {"content_range": "None", "method": "HEAD"}, matching_events[1]["args"]
-        )
-        self.assertEqual(
-            {"content_range": "bytes=0-6993", "method": "None"},
-            matching_events[2]["args"],
-        )
-
     def test_live_pypi_redirect(self) -> None:
-        f = SeekableHttpFile("http://httpbin.org/redirect-to?url=" + SAMPLE_FILE)
-        self.assertEqual(SAMPLE_FILE, f.url)
-
-    def test_live_requests_pypi(self) -> None:
-        _ = SeekableHttpFile(SAMPLE_FILE, get_range=get_range_requests)
-
-    def test_live_requests_pypi_redirect(self) -> None:
         f = SeekableHttpFile(
             "http://httpbin.org/redirect-to?url=" + SAMPLE_FILE,
-            get_range=get_range_requests,
+            get_range=self.get_range,
         )
         self.assertEqual(SAMPLE_FILE, f.url)
+
+
+@live
+class LiveUrllib3Tests(LiveBackendTests, unittest.TestCase):
+    get_range = staticmethod(get_range_urllib3)
+    status_error = HTTPError
+
+
+@live
+class LiveRequestsTests(LiveBackendTests, unittest.TestCase):
+    get_range = staticmethod(get_range_requests)
+    status_error = requests.exceptions.HTTPError
+
+
+@live
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class LiveHttpxTests(LiveBackendTests, unittest.TestCase):
+    get_range = staticmethod(get_range_httpx)
+    status_error = httpx.HTTPStatusError if httpx is not None else Exception
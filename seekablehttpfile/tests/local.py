@@ -0,0 +1,243 @@
+import threading
+import unittest
+import warnings
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from typing import Any, Callable, Type, TYPE_CHECKING
+from urllib.error import HTTPError
+from urllib.parse import urlsplit
+
+import requests.exceptions
+
+from seekablehttpfile import SeekableHttpFile
+from seekablehttpfile.core import (
+    _NO_SUFFIX_RANGE,
+    close_all_connections,
+    EtagChangedError,
+    GeneralizedResponse,
+    get_range_httpx,
+    get_range_requests,
+    get_range_urllib3,
+    get_range_urlopen,
+)
+
+try:
+    import httpx
+except ImportError:
+    httpx = None  # type:ignore[assignment,unused-ignore]
+
+# The same 292 bytes as http://timhatch.com/projects/http-tests/sequence_100.txt
+SEQUENCE_100 = b"".join(b"%d\n" % i for i in range(1, 101))
+
+if TYPE_CHECKING:
+    _Base = unittest.TestCase
+else:
+    _Base = object
+
+
+class RangeHandler(BaseHTTPRequestHandler):
+    """
+    Serves SEQUENCE_100 with range support, plus a few misbehaving paths:
+
+    /sequence_100.txt            suffix and regular ranges, strong etag
+    /no_suffix/sequence_100.txt  501 for suffix ranges, like Varnish
+    /changing/sequence_100.txt   a new etag on every request, 412 on If-Match
+    /redirect?<path>             302 to <path>
+    /404                         404
+    """
+
+    protocol_version = "HTTP/1.1"  # keep-alive
+    # Headers and body are separate writes; without this, Nagle and delayed
+    # acks add 40ms to every response.
+    disable_nagle_algorithm = True
+    server: "RangeServer"
+
+    def setup(self) -> None:
+        super().setup()
+        with self.server.lock:
+            self.server.connections += 1
+
+    def do_HEAD(self) -> None:
+        self._respond(send_body=False)
+
+    def do_GET(self) -> None:
+        self._respond(send_body=True)
+
+    def _respond(self, send_body: bool) -> None:
+        url = urlsplit(self.path)
+        if url.path == "/redirect":
+            self._empty(302, Location=url.query)
+            return
+        elif url.path == "/404":
+            self._empty(404)
+            return
+
+        etag = '"seq"'
+        if url.path.startswith("/changing/"):
+            with self.server.lock:
+                self.server.generation += 1
+                etag = f'"seq{self.server.generation}"'
+            if self.headers.get("If-Match") not in (None, etag):
+                self._empty(412)
+                return
+
+        data = SEQUENCE_100
+        rng = self.headers.get("Range")
+        headers = {"ETag": etag}
+        if rng is None:
+            status = 200
+            body = data
+        else:
+            lo, _, hi = rng[6:].partition("-")
+            if not lo:
+                if url.path.startswith("/no_suffix/"):
+                    self._empty(501)
+                    return
+                start = max(0, len(data) - int(hi))
+                end = len(data) - 1
+            else:
+                start = int(lo)
+                end = min(int(hi), len(data) - 1) if hi else len(data) - 1
+            status = 206
+            body = data[start : end + 1]
+            headers["Content-Range"] = f"bytes {start}-{end}/{len(data)}"
+
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        if send_body:
+            self.wfile.write(body)
+
+    def _empty(self, status: int, **headers: str) -> None:
+        self.send_response(status)
+        for k, v in headers.items():
+            self.send_header(k, v)
+        self.send_header("Content-Length", "0")
+        self.end_headers()
+
+    def log_message(self, *args: Any) -> None:
+        pass
+
+
+class RangeServer(ThreadingHTTPServer):
+    daemon_threads = True
+
+    def __init__(self) -> None:
+        super().__init__(("127.0.0.1", 0), RangeHandler)
+        self.lock = threading.Lock()
+        self.connections = 0
+        self.generation = 0
+
+
+def get_range_urlopen_quiet(*args: Any, **kwargs: Any) -> GeneralizedResponse:
+    with warnings.catch_warnings():
+        warnings.simplefilter("ignore", DeprecationWarning)
+        return get_range_urlopen(*args, **kwargs)
+
+
+class LocalBackendTests(_Base):
+    """
+    The live tests against a server on localhost, mixed into one TestCase per
+    backend below.  These run without internet access.
+    """
+
+    get_range: Callable[..., GeneralizedResponse]
+    status_error: Type[Exception]
+    server: RangeServer
+
+    @classmethod
+    def setUpClass(cls) -> None:
+        cls.server = RangeServer()
+        threading.Thread(
+            target=cls.server.serve_forever,
+            kwargs={"poll_interval": 0.01},  # for a quick shutdown()
+            daemon=True,
+        ).start()
+
+    @classmethod
+    def tearDownClass(cls) -> None:
+        cls.server.shutdown()
+        cls.server.server_close()
+        close_all_connections()
+
+    def setUp(self) -> None:
+        _NO_SUFFIX_RANGE.clear()
+
+    def url(self, path: str) -> str:
+        return f"http://127.0.0.1:{self.server.server_port}{path}"
+
+    def open(self, path: str, **kwargs: Any) -> SeekableHttpFile:
+        return SeekableHttpFile(self.url(path), get_range=self.get_range, **kwargs)
+
+    def test_synthetic(self) -> None:
+        f = self.open("/sequence_100.txt")
+        self.assertEqual(292, f.length)
+        self.assertEqual(b"1\n", f.read(2))
+        f.seek(-4, 2)
+        self.assertEqual(b"100\n", f.read())
+        self.assertEqual(1, f.stats["num_requests"])
+        self.assertEqual('"seq"', f.etag)
+
+    def test_reads(self) -> None:
+        f = self.open("/sequence_100.txt", precache=4)
+        self.assertEqual(b"100\n", f.read_ranges([(288, 4)])[0])
+        self.assertEqual(b"1\n2\n", f.read(4))
+        f.seek(18)
+        self.assertEqual(b"10\n11\n", f.read(6))
+        self.assertEqual(
+            [b"9\n", b"99\n"], f.read_ranges([(16, 2), (285, 3)], max_workers=2)
+        )
+        self.assertEqual(5, f.stats["num_requests"])
+
+    def test_keepalive(self) -> None:
+        f = self.open("/sequence_100.txt", precache=4)
+        before = self.server.connections
+        for start in (0, 100, 200):
+            f.seek(start)
+            self.assertEqual(SEQUENCE_100[start : start + 3], f.read(3))
+        # At most one new connection, if the pool didn't already have one.
+        self.assertLessEqual(self.server.connections - before, 1)
+
+    def test_no_suffix(self) -> None:
+        f = self.open("/no_suffix/sequence_100.txt", precache=10)
+        self.assertEqual(292, f.length)
+        self.assertEqual(SEQUENCE_100[-10:], f.end_cache)
+        self.assertEqual(b"1\n2\n", f.read(4))
+        # bytes=-10, bytes=0-9, then the tail
+        self.assertEqual(3, f.stats["num_requests"])
+
+    def test_redirect(self) -> None:
+        f = self.open("/redirect?/sequence_100.txt")
+        self.assertEqual(self.url("/sequence_100.txt"), f.url)
+        self.assertEqual(b"1\n", f.read(2))
+
+    def test_404(self) -> None:
+        with self.assertRaises(self.status_error):
+            self.open("/404")
+
+    def test_etag_changed(self) -> None:
+        f = self.open("/changing/sequence_100.txt", precache=4)
+        with self.assertRaises(EtagChangedError):
+            f.read(4)
+
+
+class LocalUrllib3Tests(LocalBackendTests, unittest.TestCase):
+    get_range = staticmethod(get_range_urllib3)
+    status_error = HTTPError
+
+
+class LocalRequestsTests(LocalBackendTests, unittest.TestCase):
+    get_range = staticmethod(get_range_requests)
+    status_error = requests.exceptions.HTTPError
+
+
+class LocalUrlopenTests(LocalBackendTests, unittest.TestCase):
+    get_range = staticmethod(get_range_urlopen_quiet)
+    status_error = HTTPError
+
+
+@unittest.skipIf(httpx is None, "httpx is not installed")
+class LocalHttpxTests(LocalBackendTests, unittest.TestCase):
+    get_range = staticmethod(get_range_httpx)
+    status_error = httpx.HTTPStatusError if httpx is not None else Exception